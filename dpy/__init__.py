@@ -1 +1,12 @@
 from __future__ import annotations
+from importlib import import_module
+from typing import Any
+
+# Submodules are imported when first accessed, so importing dpy (or one of its
+# submodules) doesn't import all of them.
+_submodules = {"convenient", "data", "ducks", "gateway", "new_data", "rest"}
+
+def __getattr__(name: str) -> Any:
+	if name in _submodules:
+		return import_module(f".{name}", __name__)
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
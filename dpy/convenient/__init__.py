@@ -7,18 +7,47 @@ from types import TracebackType
 from .cache import DefaultCache
 from .dispatch import BasicDispatcher
 from .gateway import GatewayManager
-from .managers import AIOHTTPNetworkManager
+from .runtime import LoopMonitor, install_uvloop, run
 from ..ducks import NetworkManager
-from typing import Optional, TypeVar
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, Optional, TypeVar
+
+if TYPE_CHECKING:
+	from .managers import AIOHTTPNetworkManager
+	from .recording import Recorder, ReplayNetworkManager
+	from .shared_cache import SharedMemoryCache
+	from .streams import StreamsNetworkManager
 
 _E = TypeVar("_E", bound=BaseException)
 
+# Network managers and the like are imported only when first used, as their
+# transports can be slow to import (aiohttp especially).
+_lazy = {
+	"AIOHTTPNetworkManager": ".managers",
+	"StreamsNetworkManager": ".streams",
+	"Recorder": ".recording",
+	"ReplayNetworkManager": ".recording",
+	"SharedMemoryCache": ".shared_cache"
+}
+
+def __getattr__(name: str) -> Any:
+	if name in _lazy:
+		value = getattr(import_module(_lazy[name], __name__), name)
+		globals()[name] = value
+		return value
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 class Bot(DefaultCache, BasicDispatcher):
 	_networking: NetworkManager
+	_monitor: Optional[LoopMonitor]
 
-	def __init__(self, *, networking: Optional[NetworkManager] = None):
-		self._networking = AIOHTTPNetworkManager() if networking is None \
-			else networking
+	def __init__(self, *, networking: Optional[NetworkManager] = None,
+			monitor: Optional[LoopMonitor] = None):
+		if networking is None:
+			from .managers import AIOHTTPNetworkManager
+			networking = AIOHTTPNetworkManager()
+		self._networking = networking
+		self._monitor = monitor
 		DefaultCache.__init__(self)
 		BasicDispatcher.__init__(self)
 
@@ -31,6 +60,16 @@ class Bot(DefaultCache, BasicDispatcher):
 		await self._networking.__aexit__(exception_type, exception, traceback)
 
 	async def run(self, token: str):
-		async with await self._networking.request_websocket("wss://gateway.discord.gg/") \
-				as socket:
-			await GatewayManager(socket).run(token, dispatch=self.dispatch)
+		if self._monitor is not None:
+			self._monitor.start()
+
+		try:
+			async with await self._networking.request_websocket("wss://gateway.discord.gg/") \
+					as socket:
+				gateway = GatewayManager(socket, monitor=self._monitor)
+				await gateway.run(token, dispatch=self.dispatch, cache=self,
+					dispatch_raw=self.dispatch_raw, dispatch_frame=self.dispatch_frame,
+					listening=self.listening)
+		finally:
+			if self._monitor is not None:
+				self._monitor.stop()
@@ -1,16 +1,149 @@
 from __future__ import annotations
-from ..data import User, Guild, GuildChannel
-from typing import Optional
+from ..data import AvailableGuild, Guild, GuildCategoryChannel, GuildChannel, \
+	GuildChildChannel, GuildTextChannel, Role, User, _identify
+from typing import Any, Optional
+
+def _discard(index: dict[Any, dict[int, Any]], key: Any, id: int):
+	entries = index.get(key)
+	if entries is not None:
+		entries.pop(id, None)
+		if not entries:
+			del index[key]
 
 class DefaultCache:
+	"""Caches users, guilds and guild channels by id, along with secondary
+	indexes that let the queries below avoid scanning a guild's channels or
+	roles. The indexes are updated incrementally whenever a guild is cached.
+	"""
+
+	_users: dict[int, User]
+	_guilds: dict[int, Guild]
+	_channels: dict[int, GuildChannel]
+
+	_guild_channels: dict[int, dict[int, GuildChannel]]
+	_guild_roles: dict[int, dict[int, Role]]
+	_guild_users: dict[int, set[int]]
+	_channel_guilds: dict[int, int]
+	_category_children: dict[int, dict[int, GuildChildChannel]]
+	_channel_names: dict[tuple[int, str], dict[int, GuildChannel]]
+	_role_names: dict[tuple[int, str], dict[int, Role]]
+	_user_guilds: dict[int, set[int]]
+
 	def __init__(self):
-		pass
+		self._users = {}
+		self._guilds = {}
+		self._channels = {}
+
+		self._guild_channels = {}
+		self._guild_roles = {}
+		self._guild_users = {}
+		self._channel_guilds = {}
+		self._category_children = {}
+		self._channel_names = {}
+		self._role_names = {}
+		self._user_guilds = {}
+
+	async def cache_user(self, user: User):
+		self._users[user.id] = user
+
+	async def cache_guild(self, guild: Guild):
+		# READY lists guilds as unavailable, which says nothing new about a guild
+		# that's already cached.
+		if not isinstance(guild, AvailableGuild) \
+				and isinstance(self._guilds.get(guild.id), AvailableGuild):
+			return
+
+		self._uncache_guild(guild.id)
+		self._guilds[guild.id] = guild
+		if not isinstance(guild, AvailableGuild):
+			return
+
+		channels: dict[int, GuildChannel] = {}
+		for channel in guild.channels:
+			channels[channel.id] = channel
+			self._channels[channel.id] = channel
+			self._channel_guilds[channel.id] = guild.id
+			self._channel_names.setdefault((guild.id, channel.name), {}) \
+				[channel.id] = channel
+			if isinstance(channel, GuildChildChannel) and channel.parent is not None:
+				self._category_children.setdefault(_identify(channel.parent), {}) \
+					[channel.id] = channel
+		self._guild_channels[guild.id] = channels
+
+		roles: dict[int, Role] = {}
+		for role in guild.roles:
+			roles[role.id] = role
+			self._role_names.setdefault((guild.id, role.name), {})[role.id] = role
+		self._guild_roles[guild.id] = roles
+
+		users = {_identify(guild.owner)}
+		for member in guild.members or ():
+			users.add(member.user.id)
+			await self.cache_user(member.user)
+		for user in users:
+			self._user_guilds.setdefault(user, set()).add(guild.id)
+		self._guild_users[guild.id] = users
+
+	def _uncache_guild(self, id: int):
+		# Removes everything a previous version of the guild added to the indexes.
+		for channel in self._guild_channels.pop(id, {}).values():
+			self._channels.pop(channel.id, None)
+			self._channel_guilds.pop(channel.id, None)
+			_discard(self._channel_names, (id, channel.name), channel.id)
+			if isinstance(channel, GuildChildChannel) and channel.parent is not None:
+				_discard(self._category_children, _identify(channel.parent),
+					channel.id)
+
+		for role in self._guild_roles.pop(id, {}).values():
+			_discard(self._role_names, (id, role.name), role.id)
+
+		for user in self._guild_users.pop(id, ()):
+			guilds = self._user_guilds[user]
+			guilds.discard(id)
+			if not guilds:
+				del self._user_guilds[user]
+
+	def get_user(self, id: int) -> Optional[User]:
+		return self._users.get(id)
+
+	def get_guild(self, id: int) -> Optional[Guild]:
+		return self._guilds.get(id)
+
+	def get_channel(self, id: int) -> Optional[GuildChannel]:
+		return self._channels.get(id)
+
+	async def fetch_guild(self, id: int) -> Optional[Guild]:
+		return self.get_guild(id)
+
+	def get_channel_guild(self, channel: int) -> Optional[Guild]:
+		guild = self._channel_guilds.get(channel)
+		return None if guild is None else self._guilds.get(guild)
+
+	def get_guild_channels(self, guild: int) -> list[GuildChannel]:
+		return list(self._guild_channels.get(guild, {}).values())
+
+	def get_text_channels(self, guild: int) -> list[GuildTextChannel]:
+		return [channel for channel in self._guild_channels.get(guild, {}).values() \
+			if isinstance(channel, GuildTextChannel)]
+
+	def get_categories(self, guild: int) -> list[GuildCategoryChannel]:
+		return [channel for channel in self._guild_channels.get(guild, {}).values() \
+			if isinstance(channel, GuildCategoryChannel)]
+
+	def get_category_children(self, category: int) -> list[GuildChildChannel]:
+		return list(self._category_children.get(category, {}).values())
+
+	def get_channels_named(self, guild: int, name: str) -> list[GuildChannel]:
+		return list(self._channel_names.get((guild, name), {}).values())
+
+	def get_channel_named(self, guild: int, name: str) -> Optional[GuildChannel]:
+		return next(iter(self._channel_names.get((guild, name), {}).values()), None)
 
-	async def cache_user(self, user: User): ...
-	async def cache_guild(self, user: Guild): ...
+	def get_guild_roles(self, guild: int) -> list[Role]:
+		return list(self._guild_roles.get(guild, {}).values())
 
-	def get_user(self, id: int) -> Optional[User]: ...
-	def get_guild(self, id: int) -> Optional[Guild]: ...
-	def get_channel(self, id: int) -> Optional[GuildChannel]: ...
+	def get_role_named(self, guild: int, name: str) -> Optional[Role]:
+		return next(iter(self._role_names.get((guild, name), {}).values()), None)
 
-	async def fetch_guild(self, id: int) -> Optional[Guild]: ...
+	def get_mutual_guilds(self, user: int) -> list[Guild]:
+		return [self._guilds[guild] for guild in self._user_guilds.get(user, ())]
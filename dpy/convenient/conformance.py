@@ -0,0 +1,219 @@
+"""A conformance and benchmark kit for NetworkManager implementations, run
+against a local stub server.
+
+Running this module checks and benchmarks every backend that can be imported.
+"""
+
+from __future__ import annotations
+from types import TracebackType
+from .streams import OP_BINARY, OP_CLOSE, OP_PING, OP_PONG, OP_TEXT, _GUID, \
+	_encode_frame, _read_body, _read_frame, _read_head
+from ..ducks import NetworkManager, WebsocketClosed
+from asyncio import IncompleteReadError, Server, StreamReader, StreamWriter, \
+	Task, current_task, gather, run, start_server
+from base64 import b64encode
+from hashlib import sha1
+from json import dumps
+from time import perf_counter
+from typing import Callable, Optional, TypeVar
+
+_E = TypeVar("_E", bound=BaseException)
+
+class GatewayStub:
+	"""A local server speaking just enough HTTP/1.1 and websocket.
+
+	HTTP requests are answered with their own body. Websocket connections
+	receive a Hello payload if hello (a heartbeat interval) is set, and then have
+	every message echoed back, except for the text message "close <code>
+	<reason>", which makes the server close the connection with that code.
+	"""
+
+	hello: Optional[int]
+	server: Optional[Server]
+
+	_connections: dict[Task[None], StreamWriter]
+
+	def __init__(self, *, hello: Optional[int] = None):
+		self.hello = hello
+		self.server = None
+
+		self._connections = {}
+
+	async def __aenter__(self):
+		self.server = await start_server(self._handle, "127.0.0.1", 0)
+		return self
+
+	async def __aexit__(self, exception_type: type[_E], exception: _E,
+			traceback: TracebackType):
+		if self.server is not None:
+			self.server.close()
+			await self.server.wait_closed()
+			self.server = None
+
+		for writer in self._connections.values():
+			writer.close()
+		await gather(*self._connections, return_exceptions=True)
+
+	@property
+	def port(self) -> int:
+		if self.server is None:
+			raise RuntimeError("stub is not running")
+		return self.server.sockets[0].getsockname()[1]
+
+	@property
+	def url(self) -> str:
+		return f"http://127.0.0.1:{self.port}"
+
+	@property
+	def websocket_url(self) -> str:
+		return f"ws://127.0.0.1:{self.port}/"
+
+	async def _handle(self, reader: StreamReader, writer: StreamWriter):
+		task = current_task()
+		if task is not None:
+			self._connections[task] = writer
+
+		try:
+			while True:
+				_, headers = await _read_head(reader)
+				if headers.get("upgrade", "").lower() == "websocket":
+					await self._websocket(reader, writer, headers)
+					return
+
+				body = await _read_body(reader, headers)
+				writer.write(b"HTTP/1.1 200 OK\r\ncontent-length: %d\r\n\r\n%s"
+					% (len(body), body))
+				await writer.drain()
+		except (ConnectionError, IncompleteReadError):
+			pass
+		finally:
+			writer.close()
+			if task is not None:
+				del self._connections[task]
+
+	async def _websocket(self, reader: StreamReader, writer: StreamWriter,
+			headers: dict[str, str]):
+		accept = b64encode(sha1(headers["sec-websocket-key"].encode() + _GUID)
+			.digest()).decode()
+		writer.write(("HTTP/1.1 101 Switching Protocols\r\nupgrade: websocket\r\n"
+			f"connection: Upgrade\r\nsec-websocket-accept: {accept}\r\n\r\n")
+			.encode("latin-1"))
+
+		if self.hello is not None:
+			hello = dumps({"op": 10, "s": None, "t": None,
+				"d": {"heartbeat_interval": self.hello}})
+			writer.write(_encode_frame(OP_TEXT, hello.encode(), mask=False))
+
+		while True:
+			_, opcode, payload = await _read_frame(reader)
+			if opcode == OP_CLOSE:
+				writer.write(_encode_frame(OP_CLOSE, payload[:2], mask=False))
+				await writer.drain()
+				return
+			elif opcode == OP_PING:
+				writer.write(_encode_frame(OP_PONG, payload, mask=False))
+			elif opcode == OP_TEXT and payload.startswith(b"close "):
+				_, code, reason = payload.decode().split(" ", 2)
+				writer.write(_encode_frame(OP_CLOSE,
+					int(code).to_bytes(2, "big") + reason.encode(), mask=False))
+				await writer.drain()
+				return
+			elif opcode in (OP_TEXT, OP_BINARY):
+				writer.write(_encode_frame(opcode, payload, mask=False))
+			await writer.drain()
+
+def _expect(condition: bool, message: str):
+	# Not an assert statement, so python -O doesn't skip the checks.
+	if not condition:
+		raise AssertionError(message)
+
+async def check(factory: Callable[[], NetworkManager], stub: GatewayStub):
+	"""Checks the NetworkManager built by factory against stub, raising
+	AssertionError on the first deviation.
+	"""
+
+	async with factory() as manager:
+		for body in (b"", b"hello", b"x" * 100000):
+			async with await manager.request(f"{stub.url}/echo", method="POST",
+					data=body) as response:
+				echoed = await response.body()
+				_expect(echoed == body,
+					f"HTTP body of {len(body)} bytes echoed as {len(echoed)} bytes")
+
+		async with await manager.request_websocket(stub.websocket_url) as socket:
+			for message in ("text", b"binary", "x" * 70000, b"\0" * 130):
+				await socket.send(message)
+				echoed = await socket.receive(timeout=5)
+				_expect(echoed == message, f"{type(message).__name__} message of \
+{len(message)} characters echoed as {type(echoed).__name__} of {len(echoed)}")
+
+			try:
+				await socket.receive(timeout=0.05)
+				raise AssertionError("receive returned without a message to receive")
+			except TimeoutError:
+				pass
+
+			await socket.send("after timeout")
+			_expect(await socket.receive(timeout=5) == "after timeout",
+				"message after a timed out receive was mangled")
+
+			await socket.send("close 4004 authentication failed")
+			try:
+				await socket.receive(timeout=5)
+				raise AssertionError("receive returned after the server closed")
+			except WebsocketClosed as exception:
+				_expect(exception.code == 4004,
+					f"close code 4004 reported as {exception.code}")
+
+async def benchmark(factory: Callable[[], NetworkManager], stub: GatewayStub, *,
+		messages: int = 10000, size: int = 256, window: int = 64) \
+		-> dict[str, float]:
+	"""Measures websocket round trips and throughput (with up to window messages
+	in flight) of the NetworkManager built by factory, in messages per second.
+	"""
+
+	message = "x" * size
+	results: dict[str, float] = {}
+
+	async with factory() as manager:
+		async with await manager.request_websocket(stub.websocket_url) as socket:
+			start = perf_counter()
+			for _ in range(messages // 10):
+				await socket.send(message)
+				await socket.receive()
+			results["round trips"] = messages // 10 / (perf_counter() - start)
+
+			start = perf_counter()
+			for sent in range(0, messages, window):
+				batch = min(window, messages - sent)
+				for _ in range(batch):
+					await socket.send(message)
+				for _ in range(batch):
+					await socket.receive()
+			results["throughput"] = messages / (perf_counter() - start)
+
+	return results
+
+def _backends() -> dict[str, Callable[[], NetworkManager]]:
+	from .streams import StreamsNetworkManager
+	backends: dict[str, Callable[[], NetworkManager]] = {
+		"streams": StreamsNetworkManager
+	}
+
+	try:
+		from .managers import AIOHTTPNetworkManager
+		backends["aiohttp"] = AIOHTTPNetworkManager
+	except ImportError:
+		pass
+	return backends
+
+async def main():
+	async with GatewayStub() as stub:
+		for name, factory in _backends().items():
+			await check(factory, stub)
+			results = await benchmark(factory, stub)
+			print(name, ", ".join(f"{value:.0f} {key}/s"
+				for key, value in results.items()))
+
+if __name__ == "__main__":
+	run(main())
@@ -1,32 +1,413 @@
 from __future__ import annotations
+from types import TracebackType
 from ..gateway.events import *
+from ..data import _identify
+from ..ducks import JSON
+from asyncio import AbstractEventLoop, Future, Queue, TimerHandle, \
+	get_running_loop
 from collections import defaultdict
+from heapq import heapify, heappop, heappush
 from inspect import iscoroutine
-from typing import Awaitable, Callable, TypeVar
+from typing import Any, Awaitable, Callable, Generic, Iterable, Literal, \
+	Optional, TypeVar, cast
 
 _E = TypeVar("_E", bound=Event, contravariant=True)
+_V = TypeVar("_V", bound=Event)
+_T = TypeVar("_T")
+_X = TypeVar("_X", bound=BaseException)
+_Listener = Callable[[Event], Union[Awaitable[None], None]]
+# A filtered listener: its registration order, the listener itself and the
+# predicates its index didn't already check.
+_Route = tuple[int, _Listener, tuple[tuple[str, Any], ...], Optional[str]]
+
+# The fields listeners of each event can be filtered on by equality, most
+# selective first, and the text they can be filtered on by prefix.
+_route_keys: dict[type[Event], dict[str, Callable[[Any], Any]]] = {
+	MessageCreateEvent: {
+		"channel": lambda event: _identify(event.message.channel),
+		"author": lambda event: event.message.author.id,
+		"guild": lambda event: _identify(event.message.guild)
+	}
+}
+_route_texts: dict[type[Event], Callable[[Any], str]] = {
+	MessageCreateEvent: lambda event: event.message.content
+}
+
+class _RouteIndex:
+	"""The filtered listeners of an event, indexed by one of their predicates so
+	only the listeners that may match an event are looked at.
+	"""
+
+	keys: dict[str, Callable[[Any], Any]]
+	text: Optional[Callable[[Any], str]]
+
+	by_key: dict[str, dict[Any, list[_Route]]]
+	by_prefix: dict[str, list[_Route]]
+	prefix_lengths: list[int]
+
+	def __init__(self, event: type[Event]):
+		self.keys = _route_keys.get(event, {})
+		self.text = _route_texts.get(event)
+
+		self.by_key = {key: {} for key in self.keys}
+		self.by_prefix = {}
+		self.prefix_lengths = []
+
+	def add(self, order: int, listener: _Listener, predicates: dict[str, Any]):
+		prefix: Optional[str] = predicates.pop("prefix", None)
+		if prefix is not None and self.text is None:
+			raise TypeError("this event can't be filtered by prefix")
+		for key in predicates:
+			if key not in self.keys:
+				raise TypeError(f"this event can't be filtered by {key!r}")
+
+		keys = [(key, _identify(predicates[key])) \
+			for key in self.keys if key in predicates]
+		if keys:
+			(key, value), *rest = keys
+			self.by_key[key].setdefault(value, []) \
+				.append((order, listener, tuple(rest), prefix))
+		elif prefix is not None:
+			self.by_prefix.setdefault(prefix, []).append((order, listener, (), None))
+			if len(prefix) not in self.prefix_lengths:
+				self.prefix_lengths.append(len(prefix))
+				self.prefix_lengths.sort()
+		else:
+			raise TypeError("a filtered listener needs at least one predicate")
+
+	def match(self, event: Event) -> list[_Listener]:
+		candidates: list[_Route] = []
+		for key, index in self.by_key.items():
+			if index:
+				routes = index.get(self.keys[key](event))
+				if routes:
+					candidates.extend(routes)
+
+		text = None
+		if self.text is not None:
+			text = self.text(event)
+			for length in self.prefix_lengths:
+				if length > len(text):
+					break
+				routes = self.by_prefix.get(text[:length])
+				if routes:
+					candidates.extend(routes)
+
+		if len(candidates) > 1:
+			candidates.sort(key=lambda route: route[0])
+		return [
+			listener for _, listener, rest, prefix in candidates \
+				if all(self.keys[key](event) == value for key, value in rest) \
+					and (prefix is None or cast(str, text).startswith(prefix))
+		]
+
+# Where a waiter is registered: its event, the names of the keys it waits on
+# and their values.
+_Waiting = tuple[type[Event], tuple[str, ...], tuple[Any, ...]]
+# What a waiter is: a future resolved by the first matching event, or an event
+# stream.
+_Waiter = Union["Future[Any]", "EventStream[Any]"]
+
+# A waiter's timeout in BasicDispatcher._timeouts: its deadline, the order it
+# was pushed in and its future, which is replaced by None once it's done.
+_Timeout = list[Any]
+
+# Queued by EventStream.close to wake whoever is waiting for the next event.
+_closed = object()
+
+class EventStream(Generic[_V]):
+	"""An asynchronous iterator over matching events, from when it was opened by
+	BasicDispatcher.stream until it's closed.
+
+	Unless maxsize is 0, at most maxsize events are queued, and a new event
+	arriving while the queue is full drops either the oldest queued event or
+	itself, depending on drop. dropped counts the events dropped so far.
+	"""
+
+	maxsize: int
+	drop: Literal["oldest", "newest"]
+	dropped: int
+
+	_dispatcher: BasicDispatcher
+	_waiting: Optional[_Waiting]
+	_queue: Queue[Any]
+
+	def __init__(self, dispatcher: BasicDispatcher, event: type[_V],
+			keys: dict[str, Any], *, maxsize: int = 0,
+			drop: Literal["oldest", "newest"] = "oldest"):
+		if maxsize < 0:
+			raise ValueError("maxsize can't be negative")
+		if drop not in ("oldest", "newest"):
+			raise ValueError("drop must be \"oldest\" or \"newest\"")
+
+		self.maxsize = maxsize
+		self.drop = drop
+		self.dropped = 0
+
+		self._dispatcher = dispatcher
+		# The queue itself is unbounded, so there's always room for _closed.
+		self._queue = Queue()
+		self._waiting = dispatcher._wait(event, keys, self)
+
+	def _put(self, event: _V):
+		if self.maxsize and self._queue.qsize() >= self.maxsize:
+			self.dropped = self.dropped + 1
+			if self.drop == "newest":
+				return
+			self._queue.get_nowait()
+		self._queue.put_nowait(event)
+
+	def __aiter__(self):
+		return self
+
+	async def __anext__(self) -> _V:
+		event = await self._queue.get()
+		if event is _closed:
+			# Leave it for anyone else waiting on the stream.
+			self._queue.put_nowait(_closed)
+			raise StopAsyncIteration
+		return event
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, exception_type: type[_X], exception: _X,
+			traceback: TracebackType):
+		self.close()
+
+	def close(self):
+		if self._waiting is not None:
+			self._dispatcher._unwait(self._waiting, self)
+			self._waiting = None
+			self._queue.put_nowait(_closed)
 
 def manufacture_registerer(event: type[_E]):
 	def registerer(self: BasicDispatcher,
-			function: Callable[[_E], Union[Awaitable[None], None]]):
-		self._listeners[event].append(function)
-		return function
+			function: Optional[Callable[[_E], Union[Awaitable[None], None]]] = None,
+			**predicates: Any):
+		"""Registers a listener, either for every event or, if any predicates
+		(such as channel, guild, author or prefix) are given, only for events
+		matching all of them.
+		"""
+
+		def register(function: Callable[[_E], Union[Awaitable[None], None]]):
+			if predicates:
+				self._route(event, cast(_Listener, function), dict(predicates))
+			else:
+				self._listeners[event].append(function)
+			return function
+		return register if function is None else register(function)
 	return registerer
 
+async def _call(listeners: Iterable[Callable[[_T], Any]], value: _T):
+	for listener in listeners:
+		result = listener(value)
+		if iscoroutine(result):
+			await result
+
 class BasicDispatcher:
 	_listeners: defaultdict[
 		type[Event],
 		list[Callable[[Event], Union[Awaitable[None], None]]]
 	]
+	_raw_listeners: defaultdict[
+		str,
+		list[Callable[[JSON], Union[Awaitable[None], None]]]
+	]
+	_frame_listeners: list[
+		Callable[[Union[bytes, str]], Union[Awaitable[None], None]]
+	]
+	_routes: dict[type[Event], _RouteIndex]
+	_routed: int
+	# Waiters by event, then by the names of the keys they wait on, then by
+	# the values of those keys.
+	_waiters: dict[
+		type[Event],
+		dict[tuple[str, ...], dict[tuple[Any, ...], dict[_Waiter, None]]]
+	]
+	# Timeouts of all waiters, as a heap of deadlines, with one timer for the
+	# earliest of them. Stale timeouts, whose futures are done, stay in the heap
+	# until they reach its top or outnumber the live ones.
+	_timeouts: list[_Timeout]
+	_timeouts_pushed: int
+	_timeouts_stale: int
+	_timer: Optional[TimerHandle]
 
 	def __init__(self):
 		self._listeners = defaultdict(list)
+		self._raw_listeners = defaultdict(list)
+		self._frame_listeners = []
+		self._routes = {}
+		self._routed = 0
+		self._waiters = {}
+		self._timeouts = []
+		self._timeouts_pushed = 0
+		self._timeouts_stale = 0
+		self._timer = None
+
+	def _route(self, event: type[Event], listener: _Listener,
+			predicates: dict[str, Any]):
+		routes = self._routes.get(event)
+		if routes is None:
+			routes = _RouteIndex(event)
+		routes.add(self._routed, listener, predicates)
+
+		self._routes[event] = routes
+		self._routed = self._routed + 1
+
+	def _wait(self, event: type[Event], keys: dict[str, Any],
+			waiter: _Waiter) -> _Waiting:
+		known = _route_keys.get(event, {})
+		for key in keys:
+			if key not in known:
+				raise TypeError(f"this event can't be waited on by {key!r}")
+
+		names = tuple(key for key in known if key in keys)
+		values = tuple(_identify(keys[key]) for key in names)
+		self._waiters.setdefault(event, {}).setdefault(names, {}) \
+			.setdefault(values, {})[waiter] = None
+		return event, names, values
+
+	def _unwait(self, waiting: _Waiting, waiter: _Waiter):
+		event, names, values = waiting
+		by_names = self._waiters[event]
+		by_values = by_names[names]
+		waiters = by_values[values]
+
+		del waiters[waiter]
+		if not waiters:
+			del by_values[values]
+			if not by_values:
+				del by_names[names]
+				if not by_names:
+					del self._waiters[event]
+
+	def _time_out(self, loop: AbstractEventLoop, deadline: float,
+			future: Future[Any]):
+		timeout: _Timeout = [deadline, self._timeouts_pushed, future]
+		heappush(self._timeouts, timeout)
+		self._timeouts_pushed = self._timeouts_pushed + 1
+		future.add_done_callback(lambda _: self._discard(timeout))
+
+		if self._timer is None or deadline < self._timer.when():
+			if self._timer is not None:
+				self._timer.cancel()
+			self._timer = loop.call_at(deadline, self._expire, loop)
+
+	def _discard(self, timeout: _Timeout):
+		# Timeouts that expired were already taken out of the heap.
+		if timeout[2] is None:
+			return
+		timeout[2] = None
+		self._timeouts_stale = self._timeouts_stale + 1
+
+		if self._timeouts_stale * 2 > len(self._timeouts):
+			self._timeouts = [timeout for timeout in self._timeouts \
+				if timeout[2] is not None]
+			heapify(self._timeouts)
+			self._timeouts_stale = 0
+
+			if not self._timeouts and self._timer is not None:
+				self._timer.cancel()
+				self._timer = None
+
+	def _expire(self, loop: AbstractEventLoop):
+		self._timer = None
+		now = loop.time()
+
+		while self._timeouts and (self._timeouts[0][0] <= now \
+				or self._timeouts[0][2] is None):
+			timeout = heappop(self._timeouts)
+			future: Optional[Future[Any]] = timeout[2]
+			if future is None:
+				self._timeouts_stale = self._timeouts_stale - 1
+			else:
+				timeout[2] = None
+				future.set_exception(TimeoutError())
+
+		if self._timeouts:
+			self._timer = loop.call_at(self._timeouts[0][0], self._expire, loop)
+
+	async def wait_for(self, event: type[_V], *,
+			timeout: Optional[float] = None, **keys: Any) -> _V:
+		"""Waits for the next event of type event whose keys (such as channel,
+		guild or author) equal the ones given, raising TimeoutError after timeout
+		seconds.
+		"""
+
+		loop = get_running_loop()
+		future: Future[_V] = loop.create_future()
+		waiting = self._wait(event, keys, future)
+		future.add_done_callback(lambda future: self._unwait(waiting, future))
+
+		if timeout is not None:
+			self._time_out(loop, loop.time() + timeout, future)
+		return await future
+
+	def stream(self, event: type[_V], *, maxsize: int = 0,
+			drop: Literal["oldest", "newest"] = "oldest", **keys: Any) \
+			-> EventStream[_V]:
+		"""Opens a stream of every event of type event whose keys (such as channel,
+		guild or author) equal the ones given. Events are queued from now until the
+		stream is closed, keeping at most maxsize of them (see EventStream).
+		"""
+
+		return EventStream(self, event, keys, maxsize=maxsize, drop=drop)
+
+	def listening(self, event: type[Event]) -> bool:
+		# Used by process_payload to skip building entities nobody will see.
+		return bool(self._listeners.get(event)) or event in self._routes \
+			or event in self._waiters
 
 	async def dispatch(self, event: Event):
-		for listener in self._listeners[type(event)]:
-			result = listener(event)
-			if iscoroutine(result):
-				await result
+		# Waiters are resolved first, so they don't miss the event if a listener
+		# blocks. Each group of waiters keyed on the same fields is one lookup.
+		waiters = self._waiters.get(type(event))
+		if waiters:
+			keys = _route_keys.get(type(event), {})
+			for names, by_values in list(waiters.items()):
+				matching = by_values.get(tuple(keys[name](event) for name in names))
+				for waiter in list(matching or ()):
+					if isinstance(waiter, EventStream):
+						waiter._put(event)
+					elif not waiter.done():
+						waiter.set_result(event)
+
+		# Unfiltered listeners come first, then matching filtered listeners, each in
+		# the order they were registered.
+		await _call(self._listeners[type(event)], event)
+
+		routes = self._routes.get(type(event))
+		if routes is not None:
+			await _call(routes.match(event), event)
+
+	async def dispatch_raw(self, event: str, data: JSON):
+		listeners = self._raw_listeners.get(event)
+		if listeners:
+			await _call(listeners, data)
+
+	async def dispatch_frame(self, frame: Union[bytes, str]):
+		await _call(self._frame_listeners, frame)
+
+	def on_raw(self, event: str):
+		"""Registers a listener for the decoded "d" payload of the dispatch event
+		named event (such as "MESSAGE_CREATE"). No entities are built for raw
+		listeners.
+		"""
+
+		def registerer(function: Callable[[JSON], Union[Awaitable[None], None]]):
+			self._raw_listeners[event].append(function)
+			return function
+		return registerer
+
+	def on_raw_frame(self,
+			function: Callable[[Union[bytes, str]], Union[Awaitable[None], None]]):
+		"""Registers a listener for every frame received from the gateway, before
+		it is decoded.
+		"""
+
+		self._frame_listeners.append(function)
+		return function
 
 	on_ready = manufacture_registerer(ReadyEvent)
 	on_guild_create = manufacture_registerer(GuildCreateEvent)
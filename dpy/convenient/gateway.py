@@ -1,26 +1,128 @@
 from __future__ import annotations
 from ..gateway import Event, process_payload
+from .runtime import LoopMonitor
 from ..ducks import JSON, CacheManager, GatewayManager as GatewayProtocol, \
 	NetworkManagerWebsocket, type_check
-from json import dumps, loads
+from asyncio import sleep
+from contextlib import nullcontext
+from json import JSONDecodeError, JSONDecoder, dumps, loads
 from math import inf
+from re import compile
 from time import time_ns
-from typing import Awaitable, Callable, Generic, Optional, TypeVar
+from typing import Awaitable, Callable, Generic, Optional, TypeVar, Union
 
 _N = TypeVar("_N", bound=NetworkManagerWebsocket)
 
+_decoder = JSONDecoder()
+_whitespace = compile(r"[ \t\n\r]*")
+
+class _IncrementalDecoder:
+	"""Decodes a JSON document, walking the objects and arrays of its first depth
+	levels itself and decoding anything deeper in one go, yielding to the event
+	loop after every chunk characters or so.
+
+	json.loads holds the GIL throughout, so decoding a large frame in a thread
+	would block the event loop just the same.
+	"""
+
+	text: str
+	chunk: int
+
+	_position: int
+	_decoded: int
+
+	def __init__(self, text: str, *, chunk: int):
+		self.text = text
+		self.chunk = chunk
+
+		self._position = 0
+		self._decoded = 0
+
+	async def decode(self, depth: int) -> JSON:
+		value = await self._value(depth)
+		self._skip()
+		if self._position != len(self.text):
+			raise JSONDecodeError("Extra data", self.text, self._position)
+		return value
+
+	def _skip(self):
+		match = _whitespace.match(self.text, self._position)
+		assert match is not None
+		self._position = match.end()
+
+	def _expect(self, characters: str) -> str:
+		self._skip()
+		character = self.text[self._position:self._position + 1]
+		if not character or character not in characters:
+			raise JSONDecodeError(f"Expecting one of {characters!r}", self.text,
+				self._position)
+		self._position = self._position + 1
+		return character
+
+	async def _value(self, depth: int) -> JSON:
+		self._skip()
+		start = self._position
+		if depth > 0 and self.text.startswith("{", start):
+			self._position = start + 1
+			result: dict[str, JSON] = {}
+			self._skip()
+			if self.text.startswith("}", self._position):
+				self._position = self._position + 1
+				return result
+
+			while True:
+				self._skip()
+				key, self._position = _decoder.raw_decode(self.text, self._position)
+				if not isinstance(key, str):
+					raise JSONDecodeError("Expecting property name enclosed in double \
+quotes", self.text, start)
+				self._expect(":")
+				result[key] = await self._value(depth - 1)
+				if self._expect(",}") == "}":
+					return result
+		elif depth > 0 and self.text.startswith("[", start):
+			self._position = start + 1
+			items: list[JSON] = []
+			self._skip()
+			if self.text.startswith("]", self._position):
+				self._position = self._position + 1
+				return items
+
+			while True:
+				items.append(await self._value(depth - 1))
+				if self._expect(",]") == "]":
+					return items
+
+		value, self._position = _decoder.raw_decode(self.text, start)
+		self._decoded = self._decoded + self._position - start
+		if self._decoded >= self.chunk:
+			self._decoded = 0
+			await sleep(0)
+		return value
+
 class GatewayManager(Generic[_N]):
 	socket: _N
 
 	heartbeat_interval: Optional[int]
 	waited: float
 
-	def __init__(self, socket: _N):
+	incremental_threshold: Optional[int]
+	monitor: Optional[LoopMonitor]
+
+	def __init__(self, socket: _N, *,
+			incremental_threshold: Optional[int] = 1 << 20,
+			monitor: Optional[LoopMonitor] = None):
 		self.socket = socket
 
 		self.heartbeat_interval = None
 		self.waited = 0
 
+		# Frames of at least incremental_threshold characters (such as a READY
+		# with thousands of guilds) are decoded incrementally, so other tasks get
+		# to run between every 64KiB or so of the frame.
+		self.incremental_threshold = incremental_threshold
+		self.monitor = monitor
+
 	async def heartbeat_now(self):
 		self.waited = inf
 
@@ -32,7 +134,12 @@ class GatewayManager(Generic[_N]):
 
 	async def run(self, token: str, *,
 			dispatch: Callable[[Event], Awaitable[None]],
-			cache: Optional[CacheManager] = None):
+			cache: Optional[CacheManager] = None,
+			dispatch_raw: Optional[Callable[[str, JSON], Awaitable[None]]] = None,
+			dispatch_frame: Optional[
+				Callable[[Union[bytes, str]], Awaitable[None]]
+			] = None,
+			listening: Optional[Callable[[type[Event]], bool]] = None):
 		default_timeout = 1000.0
 		sequence: Optional[int] = None
 
@@ -44,17 +151,33 @@ class GatewayManager(Generic[_N]):
 
 			try:
 				start = time_ns()
-				raw: str = str(await self.socket.receive(timeout=timeout))
-				message = type_check(loads(raw), dict[str, JSON])
-				if message["s"] is not None:
-					if isinstance(message["s"], int) or isinstance(message["s"], float):
-						sequence = type_check(message["s"], int)
+				frame = await self.socket.receive(timeout=timeout)
+				if dispatch_frame is not None:
+					await dispatch_frame(frame)
+
+				with nullcontext() if self.monitor is None else \
+						self.monitor.track(f"a frame of {len(frame)} characters"):
+					if self.incremental_threshold is not None \
+							and len(frame) >= self.incremental_threshold:
+						text = frame.decode() if isinstance(frame, bytes) else frame
+						decoded = await _IncrementalDecoder(text, chunk=1 << 16) \
+							.decode(3)
 					else:
-						raise TypeError(f"expected type float or int, found type \
+						decoded = loads(frame)
+					message = type_check(decoded, dict[str, JSON])
+					if message["s"] is not None:
+						if isinstance(message["s"], int) \
+								or isinstance(message["s"], float):
+							sequence = type_check(message["s"], int)
+						else:
+							raise TypeError(f"expected type float or int, found type \
 {type(message['s'])}")
 
-				await process_payload(message, token,
-					dispatch=dispatch, cache=cache, manager=self)
+					if self.monitor is not None:
+						self.monitor.relabel(str(message.get("t") or message["op"]))
+					await process_payload(message, token,
+						dispatch=dispatch, cache=cache, manager=self,
+						dispatch_raw=dispatch_raw, listening=listening)
 				self.waited = self.waited + ((time_ns() - start) / 1000000)
 				# We keep track of the time the processing took so we can keep track of
 				# how much time has passed since the last heartbeat (or initial
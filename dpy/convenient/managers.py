@@ -1,10 +1,11 @@
 from types import TracebackType
 from aiohttp.client_reqrep import ClientResponse
 from aiohttp.client_ws import ClientWebSocketResponse
-from ..ducks import NetworkManager, NetworkManagerResponse, NetworkManagerWebsocket
-from aiohttp import ClientSession
+from ..ducks import NetworkManager, NetworkManagerResponse, \
+	NetworkManagerWebsocket, WebsocketClosed
+from aiohttp import ClientSession, WSMsgType
 from asyncio import TimeoutError as AsyncIOTimeoutError
-from typing import Optional, TypeVar, Union, cast
+from typing import Optional, TypeVar, Union
 
 _E = TypeVar("_E", bound=BaseException)
 
@@ -78,8 +79,17 @@ class AIOHTTPNetworkManagerWebsocket:
 			-> Union[bytes, str]:
 		try:
 			response = await self.socket.receive(timeout=timeout)
-			return cast(Union[bytes, str], getattr(response, "data"))
 		except AsyncIOTimeoutError as exception:
 			raise TimeoutError() from exception
 
+		if response.type is WSMsgType.TEXT or response.type is WSMsgType.BINARY:
+			return response.data
+		elif response.type is WSMsgType.ERROR:
+			raise WebsocketClosed(self.socket.close_code, str(response.data)) \
+				from response.data
+		elif response.type is WSMsgType.CLOSE:
+			raise WebsocketClosed(response.data, response.extra or "")
+		else: # CLOSING or CLOSED
+			raise WebsocketClosed(self.socket.close_code)
+
 ___: type[NetworkManagerWebsocket] = AIOHTTPNetworkManagerWebsocket
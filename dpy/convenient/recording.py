@@ -0,0 +1,151 @@
+"""Recording of gateway traffic and its replay into a Bot, for load testing and
+reproducing incidents offline.
+
+A recording is an append-only file of records, each a little endian header of
+the frame's monotonic timestamp in nanoseconds (8 bytes), whether the frame is
+text (1 byte) and the frame's length (4 bytes), followed by the frame itself.
+"""
+
+from __future__ import annotations
+from types import TracebackType
+from ..ducks import NetworkManager, NetworkManagerResponse, \
+	NetworkManagerWebsocket, WebsocketClosed
+from asyncio import sleep
+from math import inf
+from struct import Struct
+from time import monotonic_ns
+from typing import BinaryIO, Iterator, Optional, TypeVar, Union
+
+_E = TypeVar("_E", bound=BaseException)
+
+_header = Struct("<qBI")
+
+def read_recording(path: str) -> Iterator[tuple[int, Union[bytes, str]]]:
+	"""Yields the timestamp and frame of every record in the recording at path."""
+
+	with open(path, "rb") as file:
+		while header := file.read(_header.size):
+			if len(header) < _header.size:
+				return # Cut off while being written.
+			timestamp, text, length = _header.unpack(header)
+			frame = file.read(length)
+			if len(frame) < length:
+				return
+			yield timestamp, frame.decode() if text else frame
+
+class Recorder:
+	"""Appends every frame it's given to the recording at path.
+
+	Register record as a raw frame listener (bot.on_raw_frame(recorder.record))
+	to record everything a Bot receives from the gateway.
+	"""
+
+	_file: BinaryIO
+
+	def __init__(self, path: str):
+		self._file = open(path, "ab")
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, exception_type: type[_E], exception: _E,
+			traceback: TracebackType):
+		self.close()
+
+	def close(self):
+		self._file.close()
+
+	async def record(self, frame: Union[bytes, str]):
+		text = isinstance(frame, str)
+		data = frame.encode() if isinstance(frame, str) else frame
+		self._file.write(_header.pack(monotonic_ns(), text, len(data)))
+		self._file.write(data)
+
+class ReplayNetworkManager:
+	"""A NetworkManager whose websockets replay the recording at path at speed
+	times the original speed, or as fast as possible if speed is inf. HTTP
+	requests raise ConnectionError, as there's nothing to replay them from.
+	"""
+
+	path: str
+	speed: float
+
+	def __init__(self, path: str, *, speed: float = 1.0):
+		self.path = path
+		self.speed = speed
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, exception_type: type[_E], exception: _E,
+			traceback: TracebackType):
+		pass
+
+	async def request(self, url: str, *, method: str = "GET",
+			data: Optional[Union[str, bytes]] = None, headers: dict[str, str] = {}) \
+			-> NetworkManagerResponse:
+		raise ConnectionError("replays only contain gateway traffic")
+
+	async def request_websocket(self, url: str):
+		return ReplayWebsocket(self.path, speed=self.speed)
+
+_: type[NetworkManager] = ReplayNetworkManager
+
+class ReplayWebsocket:
+	"""Receives the frames of a recording, keeping their original spacing divided
+	by speed. Sent data is discarded, and the websocket closes with code 1000 once
+	the recording runs out.
+	"""
+
+	speed: float
+
+	_frames: Iterator[tuple[int, Union[bytes, str]]]
+	_next: Optional[tuple[int, Union[bytes, str]]]
+	# The timestamp of the first frame and when it was replayed.
+	_origin: Optional[tuple[int, int]]
+
+	def __init__(self, path: str, *, speed: float = 1.0):
+		if speed <= 0:
+			raise ValueError("speed must be positive")
+
+		self.speed = speed
+
+		self._frames = read_recording(path)
+		self._next = None
+		self._origin = None
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, exception_type: type[_E], exception: _E,
+			traceback: TracebackType):
+		self._frames = iter(())
+
+	async def send(self, data: Union[bytes, str]):
+		pass
+
+	async def receive(self, timeout: Optional[Union[int, float]] = None) \
+			-> Union[bytes, str]:
+		if self._next is None:
+			self._next = next(self._frames, None)
+			if self._next is None:
+				raise WebsocketClosed(1000, "end of recording")
+
+		timestamp, frame = self._next
+		if self._origin is None:
+			self._origin = timestamp, monotonic_ns()
+
+		if self.speed != inf:
+			recorded, replayed = self._origin
+			delay = ((timestamp - recorded) / self.speed
+				- (monotonic_ns() - replayed)) / 1000000000
+			if delay > 0:
+				if timeout is not None and delay > timeout:
+					await sleep(timeout)
+					raise TimeoutError()
+				await sleep(delay)
+
+		self._next = None
+		return frame
+
+__: type[NetworkManagerWebsocket] = ReplayWebsocket
@@ -0,0 +1,158 @@
+"""Event loop setup for running bots: optional uvloop, a tuned default executor
+and a monitor reporting loop stalls.
+"""
+
+from __future__ import annotations
+from asyncio import AbstractEventLoop, Task, all_tasks, gather, \
+	get_event_loop_policy, get_running_loop, new_event_loop, set_event_loop, \
+	set_event_loop_policy, sleep
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from logging import getLogger
+from os import cpu_count
+from time import perf_counter
+from typing import Any, Callable, Coroutine, Iterator, Optional, TypeVar
+
+_T = TypeVar("_T")
+
+logger = getLogger(__name__)
+
+def install_uvloop() -> bool:
+	"""Installs uvloop's event loop policy, returning whether it is available."""
+
+	try:
+		import uvloop
+	except ImportError:
+		return False
+
+	set_event_loop_policy(uvloop.EventLoopPolicy())
+	return True
+
+class _BorrowedExecutor(ThreadPoolExecutor):
+	"""Submits work to an executor owned by someone else, which it leaves running
+	when the event loop shuts it down.
+
+	It's a ThreadPoolExecutor only because set_default_executor accepts nothing
+	else, and the loop shuts its default executor down once closed. Its own pool
+	never starts any threads, as they're only started by submit.
+	"""
+
+	_executor: Executor
+
+	def __init__(self, executor: Executor):
+		super().__init__(1)
+		self._executor = executor
+
+	def submit(self, fn: Callable[..., _T], /, *args: Any, **kwargs: Any) \
+			-> Future[_T]:
+		return self._executor.submit(fn, *args, **kwargs)
+
+def run(main: Coroutine[Any, Any, _T], *, uvloop: bool = True,
+		executor: Optional[Executor] = None, workers: Optional[int] = None) -> _T:
+	"""Runs main on a fresh event loop, using uvloop if it is requested and
+	available.
+
+	The loop's default executor is set to executor, or otherwise to a thread pool
+	of workers threads (defaulting to the number of CPUs plus four). Only the
+	thread pool is shut down once main returns; executor is left running.
+	"""
+
+	policy = get_event_loop_policy()
+	if uvloop:
+		install_uvloop()
+
+	try:
+		loop = new_event_loop()
+	finally:
+		set_event_loop_policy(policy)
+
+	set_event_loop(loop)
+	if executor is None:
+		loop.set_default_executor(ThreadPoolExecutor(
+			workers or (cpu_count() or 1) + 4, thread_name_prefix="dpy"))
+	else:
+		loop.set_default_executor(_BorrowedExecutor(executor))
+
+	try:
+		return loop.run_until_complete(main)
+	finally:
+		try:
+			# Like asyncio.run, cancel whatever is left running.
+			pending = all_tasks(loop)
+			for task in pending:
+				task.cancel()
+			loop.run_until_complete(gather(*pending, return_exceptions=True))
+
+			loop.run_until_complete(loop.shutdown_asyncgens())
+			loop.run_until_complete(loop.shutdown_default_executor())
+		finally:
+			set_event_loop(None)
+			loop.close()
+
+def _log_stall(lag: float, payload: Optional[str]):
+	logger.warning("event loop stalled for %.1fms while processing %s",
+		lag * 1000, payload or "nothing")
+
+class LoopMonitor:
+	"""Measures how late the event loop wakes a sleeping task, reporting any lag
+	beyond threshold seconds along with the payload being processed at the time.
+
+	Payloads are labelled by wrapping their processing in track; GatewayManager
+	does this for each frame, relabelling it with the dispatch event name or op
+	code once the frame is decoded.
+	"""
+
+	interval: float
+	threshold: float
+	report: Callable[[float, Optional[str]], None]
+
+	_task: Optional[Task[None]]
+	_active: Optional[str]
+	_last: Optional[str]
+
+	def __init__(self, *, interval: float = 0.1, threshold: float = 0.1,
+			report: Callable[[float, Optional[str]], None] = _log_stall):
+		self.interval = interval
+		self.threshold = threshold
+		self.report = report
+
+		self._task = None
+		self._active = None
+		self._last = None
+
+	def start(self, loop: Optional[AbstractEventLoop] = None):
+		if self._task is None:
+			loop = get_running_loop() if loop is None else loop
+			self._task = loop.create_task(self._monitor())
+
+	def stop(self):
+		if self._task is not None:
+			self._task.cancel()
+			self._task = None
+
+	@contextmanager
+	def track(self, payload: str) -> Iterator[None]:
+		self._active = payload
+		try:
+			yield
+		finally:
+			self._last = self._active or payload
+			self._active = None
+
+	def relabel(self, payload: str):
+		"""Renames the payload being tracked."""
+
+		if self._active is not None:
+			self._active = payload
+
+	async def _monitor(self):
+		while True:
+			start = perf_counter()
+			await sleep(self.interval)
+			lag = perf_counter() - start - self.interval
+
+			if lag > self.threshold:
+				# A stall that already ended was most likely caused by the payload
+				# that was processed last.
+				self.report(lag, self._active or self._last)
+			self._last = None
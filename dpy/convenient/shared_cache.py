@@ -0,0 +1,510 @@
+"""A CacheManager kept in shared memory, so one process can cache gateway
+updates that any number of other processes on the host read.
+
+The arena starts with a header (sequence number, bytes of records used, slot
+count), followed by an open addressing table of slots mapping an entity's kind
+and id to its record, followed by the records themselves. Each kind of entity
+has a fixed record layout: a struct of the entity's class and its fixed size
+fields, followed by the ids it refers to and then its text. Guilds refer to
+their roles, channels and members by id, and those have records of their own,
+so nothing is stored twice.
+
+Entities are read in place. get_guild and the like only look up the record and
+return an entity whose properties are decoded from the arena whenever they're
+accessed, so they always show the latest record of that entity.
+
+The writer makes the sequence number odd while it changes the arena and even
+again once it's done, and readers retry any read during which the sequence
+number was odd or changed (a seqlock), so readers never block the writer and
+never see a half written entity. Readers back off after a few quick retries,
+and give up with TimeoutError if the writer doesn't finish within a second (as
+happens if it died mid write).
+"""
+
+from __future__ import annotations
+from ..data import AvailableGuild, Entity, Guild, GuildCategoryChannel, \
+	GuildChannel, GuildChildChannel, GuildTextChannel, Member, PartialGuild, \
+	Role, SelfUser, User, _constructor, _constructors_of, _identify
+from functools import partial
+from multiprocessing import parent_process
+from multiprocessing.shared_memory import SharedMemory
+from os import name as _os_name
+from struct import Struct, pack, unpack_from
+from time import monotonic, sleep
+from typing import Any, Callable, Optional, TypeVar, cast
+
+_T = TypeVar("_T", bound=Entity)
+_R = TypeVar("_R")
+# Reads a property of the entity with id from its record at offset.
+_Reader = Callable[["SharedMemoryCache", memoryview, int, int, int], Any]
+
+_header = Struct("<QQQ") # sequence, used, slots
+_sequence = Struct("<Q")
+_slot = Struct("<BxxxIQQ") # kind, length, id, offset
+_header_size = 64 # Rounded up to a cache line.
+
+# Records. Users and roles are followed by their name, channels by their name
+# and topic, and guilds by the ids of their roles, channels and members, then
+# their name.
+_named = Struct("<BxH") # class, name length
+# class, type, flags, parent, name length, topic length
+_channel = Struct("<BBBxQHH")
+# class, name length, roles, channels, members, owner
+_guild = Struct("<BxHHxxIIQ")
+
+_NSFW = 1
+_PARENT = 2
+_TOPIC = 4
+_NO_MEMBERS = 0xFFFFFFFF
+
+_spins = 64
+_read_timeout = 1.0
+
+_USER = 1
+_GUILD = 2
+_CHANNEL = 3
+_ROLE = 4
+
+# The classes records can be of, by the code records store them as.
+_classes: tuple[type[Entity], ...] = (User, SelfUser, Role, Guild, PartialGuild,
+	AvailableGuild, GuildChannel, GuildCategoryChannel, GuildChildChannel,
+	GuildTextChannel)
+_codes = {Class: code for code, Class in enumerate(_classes)}
+
+# Names of the arenas this process created. Forked processes inherit them
+# along with the resource tracker.
+_created: set[str] = set()
+
+def _attach(name: str) -> SharedMemory:
+	try:
+		return SharedMemory(name, track=False)
+	except TypeError:
+		# Before Python 3.13, attaching registers the memory with the resource
+		# tracker, which unlinks it once every process using the tracker exits.
+		# Processes started by multiprocessing share their parent's tracker, where
+		# the registration is the writer's to remove. Any other process has a
+		# tracker of its own, which would unlink the arena under the writer.
+		memory = SharedMemory(name)
+		if _os_name == "posix" and parent_process() is None \
+				and memory.name not in _created:
+			from multiprocessing import resource_tracker
+			resource_tracker.unregister(f"/{memory.name}", "shared_memory")
+		return memory
+
+def _text(buffer: memoryview, start: int, length: int) -> str:
+	return str(buffer[start:start + length], "utf-8")
+
+def _ids(buffer: memoryview, start: int, count: int) -> tuple[int, ...]:
+	return unpack_from(f"<{count}Q", buffer, start)
+
+def _id(cache: SharedMemoryCache, buffer: memoryview, offset: int, id: int,
+		sequence: int) -> int:
+	return id
+
+def _name(cache: SharedMemoryCache, buffer: memoryview, offset: int, id: int,
+		sequence: int) -> str:
+	_, length = _named.unpack_from(buffer, offset)
+	return _text(buffer, offset + _named.size, length)
+
+def _channel_name(cache: SharedMemoryCache, buffer: memoryview, offset: int,
+		id: int, sequence: int) -> str:
+	_, _, _, _, length, _ = _channel.unpack_from(buffer, offset)
+	return _text(buffer, offset + _channel.size, length)
+
+def _channel_type(cache: SharedMemoryCache, buffer: memoryview, offset: int,
+		id: int, sequence: int) -> int:
+	return buffer[offset + 1]
+
+def _channel_parent(cache: SharedMemoryCache, buffer: memoryview, offset: int,
+		id: int, sequence: int) -> Any:
+	_, _, flags, parent, _, _ = _channel.unpack_from(buffer, offset)
+	if not flags & _PARENT:
+		return None
+	# Like any entity reference, just the id if the parent isn't cached.
+	entity = cache._entity(_CHANNEL, parent, sequence)
+	return parent if entity is None else entity
+
+def _channel_topic(cache: SharedMemoryCache, buffer: memoryview, offset: int,
+		id: int, sequence: int) -> Optional[str]:
+	_, _, flags, _, name, length = _channel.unpack_from(buffer, offset)
+	return _text(buffer, offset + _channel.size + name, length) \
+		if flags & _TOPIC else None
+
+def _channel_nsfw(cache: SharedMemoryCache, buffer: memoryview, offset: int,
+		id: int, sequence: int) -> bool:
+	return bool(buffer[offset + 2] & _NSFW)
+
+def _guild_name(cache: SharedMemoryCache, buffer: memoryview, offset: int,
+		id: int, sequence: int) -> str:
+	_, length, roles, channels, members, _ = _guild.unpack_from(buffer, offset)
+	ids = roles + channels + (0 if members == _NO_MEMBERS else members)
+	return _text(buffer, offset + _guild.size + 8 * ids, length)
+
+def _guild_owner(cache: SharedMemoryCache, buffer: memoryview, offset: int,
+		id: int, sequence: int) -> Any:
+	_, _, _, _, _, owner = _guild.unpack_from(buffer, offset)
+	entity = cache._entity(_USER, owner, sequence)
+	return owner if entity is None else entity
+
+def _guild_roles(cache: SharedMemoryCache, buffer: memoryview, offset: int,
+		id: int, sequence: int) -> list[Role]:
+	_, _, roles, _, _, _ = _guild.unpack_from(buffer, offset)
+	return [cache._view(Role, _ROLE, role) \
+		for role in _ids(buffer, offset + _guild.size, roles)]
+
+def _guild_channels(cache: SharedMemoryCache, buffer: memoryview, offset: int,
+		id: int, sequence: int) -> list[Any]:
+	_, _, roles, channels, _, _ = _guild.unpack_from(buffer, offset)
+	# Channels are of different classes, so their records have to be found now.
+	return [cache._entity(_CHANNEL, channel, sequence) \
+		for channel in _ids(buffer, offset + _guild.size + 8 * roles, channels)]
+
+def _guild_members(cache: SharedMemoryCache, buffer: memoryview, offset: int,
+		id: int, sequence: int) -> Optional[list[Member]]:
+	_, _, roles, channels, members, _ = _guild.unpack_from(buffer, offset)
+	if members == _NO_MEMBERS:
+		return None
+	start = offset + _guild.size + 8 * (roles + channels)
+	# A member is read from the record of its user.
+	return [cache._view(Member, _USER, user) \
+		for user in _ids(buffer, start, members)]
+
+def _member_user(cache: SharedMemoryCache, buffer: memoryview, offset: int,
+		id: int, sequence: int) -> Optional[Entity]:
+	return cache._entity(_USER, id, sequence)
+
+_user_readers: dict[str, _Reader] = {"id": _id, "username": _name}
+_channel_readers: dict[str, _Reader] = {
+	"id": _id,
+	"name": _channel_name,
+	"type": _channel_type,
+	"parent": _channel_parent,
+	"topic": _channel_topic,
+	"nsfw": _channel_nsfw
+}
+_guild_readers: dict[str, _Reader] = {
+	"id": _id,
+	"name": _guild_name,
+	"owner": _guild_owner,
+	"roles": _guild_roles,
+	"channels": _guild_channels,
+	"members": _guild_members
+}
+_readers: dict[type[Entity], dict[str, _Reader]] = {
+	User: _user_readers,
+	SelfUser: _user_readers,
+	Role: {"id": _id, "name": _name},
+	Member: {"user": _member_user},
+	**{Class: _guild_readers for Class in (Guild, PartialGuild, AvailableGuild)},
+	**{Class: _channel_readers for Class in (GuildChannel, GuildCategoryChannel,
+		GuildChildChannel, GuildTextChannel)}
+}
+
+# The readers of each class by constructor, the way __property_map__ is keyed.
+_properties: dict[type[Entity], dict[_constructor[Any], _Reader]] = {}
+
+def _properties_of(Class: type[Entity]) -> dict[_constructor[Any], _Reader]:
+	properties = _properties.get(Class)
+	if properties is None:
+		properties = _properties[Class] = {
+			property: _readers[Class][key] for key, property in _constructors_of(Class)
+		}
+	return properties
+
+def _record(entity: Entity) -> tuple[int, int, bytes]:
+	# The kind, id and record of an entity.
+	code = next(_codes[Class] for Class in type(entity).__mro__ \
+		if Class in _codes)
+
+	if isinstance(entity, (User, Role)):
+		name = (entity.username if isinstance(entity, User) else entity.name) \
+			.encode()
+		return _USER if isinstance(entity, User) else _ROLE, entity.id, \
+			_named.pack(code, len(name)) + name
+
+	if isinstance(entity, GuildChannel):
+		name, topic = entity.name.encode(), b""
+		flags, parent = 0, 0
+		if isinstance(entity, GuildChildChannel) and entity.parent is not None:
+			flags, parent = flags | _PARENT, _identify(entity.parent)
+		if isinstance(entity, GuildTextChannel):
+			if entity.nsfw:
+				flags = flags | _NSFW
+			if entity.topic is not None:
+				flags, topic = flags | _TOPIC, entity.topic.encode()
+		return _CHANNEL, entity.id, _channel.pack(code, entity.type, flags, parent,
+			len(name), len(topic)) + name + topic
+
+	if isinstance(entity, Guild):
+		name, owner, ids = b"", 0, []
+		roles, channels, members = 0, 0, _NO_MEMBERS
+		if isinstance(entity, PartialGuild):
+			name, owner = entity.name.encode(), _identify(entity.owner)
+			ids.extend(role.id for role in entity.roles)
+			roles = len(ids)
+		if isinstance(entity, AvailableGuild):
+			ids.extend(channel.id for channel in entity.channels)
+			channels = len(entity.channels)
+			if entity.members is not None:
+				ids.extend(member.user.id for member in entity.members)
+				members = len(entity.members)
+		return _GUILD, entity.id, _guild.pack(code, len(name), roles, channels,
+			members, owner) + pack(f"<{len(ids)}Q", *ids) + name
+
+	raise TypeError(f"can't cache entities of {type(entity)}")
+
+class _Fields:
+	"""The __property_map__ of an entity read from a SharedMemoryCache, which
+	decodes each property from the entity's record when it's accessed.
+	"""
+
+	__slots__ = "_cache", "_kind", "_id", "_properties", "_sequence", "_offset"
+	_cache: SharedMemoryCache
+	_kind: int
+	_id: int
+	_properties: dict[_constructor[Any], _Reader]
+	# Where the record was as of the sequence number, -1 if not yet looked up.
+	_sequence: int
+	_offset: int
+
+	def __init__(self, cache: SharedMemoryCache, kind: int, id: int,
+			properties: dict[_constructor[Any], _Reader], sequence: int,
+			offset: int):
+		self._cache = cache
+		self._kind = kind
+		self._id = id
+		self._properties = properties
+		self._sequence = sequence
+		self._offset = offset
+
+	def __getitem__(self, property: _constructor[Any]) -> Callable[[], Any]:
+		return partial(self._cache._stable, partial(self._read,
+			self._properties[property]))
+
+	def _read(self, reader: _Reader, sequence: int) -> Any:
+		cache = self._cache
+		# Any write since the record was found may have moved it.
+		if sequence != self._sequence:
+			_, length, self._offset = cache._find(self._kind, self._id)
+			if not length:
+				raise LookupError(f"entity {self._id} is no longer cached")
+			self._sequence = sequence
+		return reader(cache, cache._buffer, self._offset, self._id, sequence)
+
+class SharedMemoryCache:
+	"""A cache in a shared memory arena. Create the arena once in the writer with
+	SharedMemoryCache.create, and attach to it by name in readers with
+	SharedMemoryCache.attach. Only the writer may cache entities.
+
+	Looking up an entity, and reading any of its properties, waits for the
+	writer to finish whatever it's writing. As that's usually a matter of
+	microseconds, it spins and then sleeps rather than awaiting, blocking the
+	event loop until it raises TimeoutError after a second.
+	"""
+
+	_memory: SharedMemory
+	_buffer: memoryview
+	_writer: bool
+	_slots: int
+	_records: int
+
+	def __init__(self, memory: SharedMemory, *, writer: bool):
+		self._memory = memory
+		self._buffer = memory.buf
+		self._writer = writer
+		_, _, self._slots = _header.unpack_from(self._buffer)
+		self._records = _header_size + self._slots * _slot.size
+
+	@classmethod
+	def create(cls, name: Optional[str] = None, *, size: int = 64 << 20,
+			slots: int = 1 << 17) -> SharedMemoryCache:
+		"""Creates an arena of size bytes with room for slots entities (rounded up
+		to a power of two) and returns its writer.
+		"""
+
+		slots = 1 << (slots - 1).bit_length()
+		if size <= _header_size + slots * _slot.size:
+			raise ValueError("size is too small to fit the slot table")
+
+		memory = SharedMemory(name, create=True, size=size)
+		_created.add(memory.name)
+		_header.pack_into(memory.buf, 0, 0, 0, slots)
+		return cls(memory, writer=True)
+
+	@classmethod
+	def attach(cls, name: str) -> SharedMemoryCache:
+		"""Returns a reader of the arena called name."""
+
+		return cls(_attach(name), writer=False)
+
+	@property
+	def name(self) -> str:
+		return self._memory.name
+
+	def close(self):
+		"""Detaches from the arena. Entities read from it can't be used after."""
+
+		self._buffer.release()
+		self._memory.close()
+
+	def unlink(self):
+		"""Destroys the arena once every process has closed it."""
+
+		self._memory.unlink()
+
+	def _find(self, kind: int, id: int) -> tuple[int, int, int]:
+		"""Returns the position of the slot of kind and id (or of the empty slot
+		it should go in), and the length and offset of its record.
+		"""
+
+		mask = self._slots - 1
+		index = ((id * 0x9E3779B97F4A7C15) >> 17 ^ kind) & mask
+		# Give up after looking at every slot, as a concurrent write can make the
+		# table look full to a reader.
+		for _ in range(self._slots):
+			position = _header_size + index * _slot.size
+			slot_kind, length, slot_id, offset = _slot.unpack_from(self._buffer,
+				position)
+			if slot_kind == 0 or slot_kind == kind and slot_id == id:
+				return position, length if slot_kind else 0, offset
+			index = (index + 1) & mask
+		return -1, 0, 0
+
+	def _stable(self, read: Callable[[int], _R]) -> _R:
+		"""Calls read with the sequence number until it reads nothing the writer
+		changed in the meantime, and returns what it read.
+		"""
+
+		buffer = self._buffer
+		attempts = 0
+		deadline: Optional[float] = None
+		while True:
+			sequence, = _sequence.unpack_from(buffer)
+			if not sequence & 1:
+				try:
+					value = read(sequence)
+				except Exception:
+					# A write in the middle of the read can make it read anything.
+					if _sequence.unpack_from(buffer)[0] == sequence:
+						raise
+				else:
+					if _sequence.unpack_from(buffer)[0] == sequence:
+						return value
+
+			attempts = attempts + 1
+			if attempts < _spins:
+				continue # Writes are short, so just try again.
+
+			now = monotonic()
+			if deadline is None:
+				deadline = now + _read_timeout
+			elif now > deadline:
+				raise TimeoutError("the writer of the shared cache didn't finish \
+writing, it may have died mid write")
+			sleep(min(0.001, 0.00001 * (attempts - _spins + 1)))
+
+	def _view(self, Class: type[_T], kind: int, id: int, sequence: int = -1,
+			offset: int = 0) -> _T:
+		# An entity of Class whose properties are read from the record of kind
+		# and id.
+		entity = object.__new__(Class)
+		# Entity's property descriptors only ever index __property_map__.
+		cast(Any, entity).__property_map__ = _Fields(self, kind, id,
+			_properties_of(Class), sequence, offset)
+		return entity
+
+	def _entity(self, kind: int, id: int, sequence: int) -> Optional[Entity]:
+		# Only for use within _stable, which checks what was read.
+		_, length, offset = self._find(kind, id)
+		if not length:
+			return None
+		return self._view(_classes[self._buffer[offset]], kind, id, sequence,
+			offset)
+
+	def _get(self, kind: int, id: int, Type: type[_T]) -> Optional[_T]:
+		entity = self._stable(partial(self._entity, kind, id))
+		if entity is not None and not isinstance(entity, Type):
+			raise TypeError(f"expected type {Type}, found record of {type(entity)}")
+		return entity
+
+	def _compact(self, used: int) -> int:
+		# Copies every live record to the start of the record region, in order.
+		live: list[tuple[int, bytes]] = []
+		for index in range(self._slots):
+			position = _header_size + index * _slot.size
+			kind, length, _, offset = _slot.unpack_from(self._buffer, position)
+			if kind:
+				live.append((position, bytes(self._buffer[offset:offset + length])))
+
+		offset = self._records
+		for position, record in live:
+			self._buffer[offset:offset + len(record)] = record
+			kind, length, id, _ = _slot.unpack_from(self._buffer, position)
+			_slot.pack_into(self._buffer, position, kind, length, id, offset)
+			offset = offset + len(record)
+		return offset - self._records
+
+	def _write(self, entities: list[Entity]):
+		if not self._writer:
+			raise RuntimeError("only the process that created the cache can write to \
+it")
+
+		records = [_record(entity) for entity in entities]
+
+		buffer = self._buffer
+		sequence, used, slots = _header.unpack_from(buffer)
+		_header.pack_into(buffer, 0, sequence + 1, used, slots)
+		try:
+			for kind, id, record in records:
+				if self._records + used + len(record) > len(buffer):
+					used = self._compact(used)
+					if self._records + used + len(record) > len(buffer):
+						raise MemoryError("shared cache is out of space")
+
+				position, _, _ = self._find(kind, id)
+				if position < 0:
+					raise MemoryError("shared cache is out of slots")
+
+				offset = self._records + used
+				buffer[offset:offset + len(record)] = record
+				_slot.pack_into(buffer, position, kind, len(record), id, offset)
+				used = used + len(record)
+		finally:
+			_header.pack_into(buffer, 0, sequence + 2, used, slots)
+
+	async def cache_user(self, user: User):
+		self._write([user])
+
+	async def cache_guild(self, guild: Guild):
+		# Don't let an unavailable guild from READY replace an available one. Only
+		# the writer writes, so it can read without the seqlock.
+		if not isinstance(guild, AvailableGuild):
+			_, length, offset = self._find(_GUILD, guild.id)
+			if length and _classes[self._buffer[offset]] is not Guild:
+				return
+
+		entities: list[Entity] = [guild]
+		if isinstance(guild, PartialGuild):
+			entities.extend(guild.roles)
+		if isinstance(guild, AvailableGuild):
+			entities.extend(guild.channels)
+			entities.extend(member.user for member in guild.members or ())
+		self._write(entities)
+
+	def get_user(self, id: int) -> Optional[User]:
+		"""Returns the user with id, which may block (see SharedMemoryCache)."""
+
+		return self._get(_USER, id, User)
+
+	def get_guild(self, id: int) -> Optional[Guild]:
+		"""Returns the guild with id, which may block (see SharedMemoryCache)."""
+
+		return self._get(_GUILD, id, Guild)
+
+	def get_channel(self, id: int) -> Optional[GuildChannel]:
+		"""Returns the channel with id, which may block (see SharedMemoryCache)."""
+
+		return self._get(_CHANNEL, id, GuildChannel)
+
+	async def fetch_guild(self, id: int) -> Optional[Guild]:
+		return self.get_guild(id)
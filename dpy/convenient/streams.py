@@ -0,0 +1,498 @@
+"""A NetworkManager built directly on asyncio, with a minimal HTTP/1.1 client
+(with keep-alive) on streams and a websocket client on a protocol.
+"""
+
+from __future__ import annotations
+from types import TracebackType
+from ..ducks import NetworkManager, NetworkManagerResponse, \
+	NetworkManagerWebsocket, WebsocketClosed
+from asyncio import AbstractEventLoop, BaseTransport, Future, \
+	IncompleteReadError, Protocol, StreamReader, StreamWriter, Transport, \
+	get_running_loop, open_connection
+from base64 import b64encode
+from collections import deque
+from hashlib import sha1
+from os import urandom
+from struct import Struct
+from typing import Optional, TypeVar, Union, cast
+from urllib.parse import urlsplit
+
+_E = TypeVar("_E", bound=BaseException)
+_Address = tuple[str, int, bool]
+
+_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+# Reading from a websocket pauses while this many messages are unreceived, and
+# resumes once they're down to _low_water.
+_high_water = 1024
+_low_water = 256
+
+def _address(url: str) -> tuple[_Address, str]:
+	parts = urlsplit(url)
+	secure = parts.scheme in ("https", "wss")
+	if parts.hostname is None:
+		raise ValueError(f"url {url!r} has no host")
+
+	port = parts.port or (443 if secure else 80)
+	path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+	return (parts.hostname, port, secure), path
+
+def _host(address: _Address) -> str:
+	host, port, secure = address
+	return host if port == (443 if secure else 80) else f"{host}:{port}"
+
+def _mask(payload: bytes, key: bytes) -> bytes:
+	# XOR the whole payload at once as one big integer rather than byte by byte.
+	length = len(payload)
+	if length == 0:
+		return payload
+
+	key = (key * (length // 4 + 1))[:length]
+	return (int.from_bytes(payload, "little") ^ int.from_bytes(key, "little")) \
+		.to_bytes(length, "little")
+
+_short_header = Struct("!BB").pack
+_medium_header = Struct("!BBH").pack
+_long_header = Struct("!BBQ").pack
+
+def _encode_frame(opcode: int, payload: bytes, *, mask: bool) -> bytes:
+	first = 0x80 | opcode
+	masked = 0x80 if mask else 0
+	length = len(payload)
+
+	if length < 126:
+		header = _short_header(first, masked | length)
+	elif length < 1 << 16:
+		header = _medium_header(first, masked | 126, length)
+	else:
+		header = _long_header(first, masked | 127, length)
+
+	if mask:
+		key = urandom(4)
+		return b"".join((header, key, _mask(payload, key)))
+	return header + payload
+
+async def _read_frame(reader: StreamReader) -> tuple[bool, int, bytes]:
+	first, second = await reader.readexactly(2)
+	length = second & 0x7F
+	if length == 126:
+		length = int.from_bytes(await reader.readexactly(2), "big")
+	elif length == 127:
+		length = int.from_bytes(await reader.readexactly(8), "big")
+
+	if second & 0x80:
+		key = await reader.readexactly(4)
+		payload = _mask(await reader.readexactly(length), key)
+	else:
+		payload = await reader.readexactly(length)
+	return bool(first & 0x80), first & 0x0F, payload
+
+async def _read_head(reader: StreamReader) -> tuple[list[str], dict[str, str]]:
+	"""Reads the start line (split into its parts) and headers of a message."""
+
+	return _parse_head(await reader.readuntil(b"\r\n\r\n"))
+
+def _parse_head(head: bytes) -> tuple[list[str], dict[str, str]]:
+	lines = head.decode("latin-1").split("\r\n")
+
+	headers: dict[str, str] = {}
+	for line in lines[1:]:
+		if line:
+			name, _, value = line.partition(":")
+			headers[name.strip().lower()] = value.strip()
+	return lines[0].split(" ", 2), headers
+
+def _bodiless(status: int, method: str) -> bool:
+	return method == "HEAD" or status < 200 or status in (204, 304)
+
+def _delimited(headers: dict[str, str], status: int, method: str) -> bool:
+	"""Returns whether the end of a response's body is known before the server
+	closes the connection.
+	"""
+
+	return _bodiless(status, method) or "content-length" in headers \
+		or "chunked" in headers.get("transfer-encoding", "")
+
+def _keep_alive(version: str, headers: dict[str, str]) -> bool:
+	connection = headers.get("connection", "").lower()
+	return connection == "keep-alive" if version == "HTTP/1.0" \
+		else connection != "close"
+
+async def _read_body(reader: StreamReader, headers: dict[str, str], *,
+		status: Optional[int] = None, method: str = "GET") -> bytes:
+	"""Reads the body of a message, which is a response to a method request if
+	status is set and a request otherwise.
+	"""
+
+	if status is not None and _bodiless(status, method):
+		return b""
+	elif "chunked" in headers.get("transfer-encoding", ""):
+		chunks: list[bytes] = []
+		while True:
+			size = int((await reader.readuntil(b"\r\n")).split(b";", 1)[0], 16)
+			if size == 0:
+				# Skip trailers.
+				while await reader.readuntil(b"\r\n") != b"\r\n":
+					pass
+				return b"".join(chunks)
+			chunks.append(await reader.readexactly(size))
+			await reader.readexactly(2)
+	elif "content-length" in headers:
+		return await reader.readexactly(int(headers["content-length"]))
+	elif status is not None:
+		# The body of a response without a length runs until the server closes
+		# the connection.
+		return await reader.read()
+	else:
+		return b""
+
+class StreamsNetworkManager:
+	_pool: dict[_Address, list[tuple[StreamReader, StreamWriter]]]
+
+	def __init__(self):
+		self._pool = {}
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, exception_type: type[_E], exception: _E,
+			traceback: TracebackType):
+		for connections in self._pool.values():
+			for _, writer in connections:
+				writer.close()
+		self._pool.clear()
+
+	async def _connect(self, address: _Address) \
+			-> tuple[StreamReader, StreamWriter]:
+		host, port, secure = address
+		return await open_connection(host, port, ssl=True if secure else None)
+
+	def _release(self, address: _Address, reader: StreamReader,
+			writer: StreamWriter):
+		self._pool.setdefault(address, []).append((reader, writer))
+
+	async def request(self, url: str, *, method: str = "GET",
+			data: Optional[Union[str, bytes]] = None, headers: dict[str, str] = {}):
+		address, path = _address(url)
+		body = data.encode() if isinstance(data, str) else data or b""
+		head = "".join((
+			f"{method} {path} HTTP/1.1\r\nhost: {_host(address)}\r\n",
+			f"content-length: {len(body)}\r\n",
+			*(f"{name}: {value}\r\n" for name, value in headers.items()),
+			"\r\n"
+		)).encode("latin-1")
+
+		pooled = self._pool.get(address)
+		while True:
+			reused = bool(pooled)
+			reader, writer = pooled.pop() if pooled else \
+				await self._connect(address)
+
+			try:
+				writer.write(head + body)
+				await writer.drain()
+				start, response_headers = await _read_head(reader)
+				# Skip interim responses such as 100 Continue.
+				while 100 <= int(start[1]) < 200:
+					start, response_headers = await _read_head(reader)
+			except (ConnectionError, IncompleteReadError):
+				writer.close()
+				# The server may have closed an idle pooled connection, so retry
+				# those on another connection.
+				if reused:
+					continue
+				raise
+
+			return StreamsNetworkManagerResponse(self, address, reader, writer,
+				method, int(start[1]), response_headers,
+				keep_alive=_keep_alive(start[0], response_headers))
+
+	async def request_websocket(self, url: str):
+		address, path = _address(url)
+		host, port, secure = address
+		loop = get_running_loop()
+		socket = StreamsNetworkManagerWebsocket(loop)
+		transport, _ = await loop.create_connection(lambda: socket, host, port,
+			ssl=True if secure else None)
+
+		key = b64encode(urandom(16)).decode()
+		transport.write((
+			f"GET {path} HTTP/1.1\r\nhost: {_host(address)}\r\n"
+			"upgrade: websocket\r\nconnection: Upgrade\r\n"
+			f"sec-websocket-key: {key}\r\nsec-websocket-version: 13\r\n\r\n"
+		).encode("latin-1"))
+
+		start, headers = await socket._handshake
+		status = int(start[1])
+		accept = b64encode(sha1(key.encode() + _GUID).digest()).decode()
+		if status != 101 or headers.get("sec-websocket-accept") != accept:
+			transport.close()
+			raise ConnectionError(f"websocket handshake with {url} failed with \
+status {status}")
+
+		return socket
+
+_: type[NetworkManager] = StreamsNetworkManager
+
+class StreamsNetworkManagerResponse:
+	status: int
+	headers: dict[str, str]
+
+	_manager: StreamsNetworkManager
+	_address: _Address
+	_reader: StreamReader
+	_writer: StreamWriter
+	_method: str
+	_keep_alive: bool
+	_body: Optional[bytes]
+
+	def __init__(self, manager: StreamsNetworkManager, address: _Address,
+			reader: StreamReader, writer: StreamWriter, method: str, status: int,
+			headers: dict[str, str], *, keep_alive: bool = True):
+		self.status = status
+		self.headers = headers
+
+		self._manager = manager
+		self._address = address
+		self._reader = reader
+		self._writer = writer
+		self._method = method
+		self._keep_alive = keep_alive
+		self._body = None
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, exception_type: type[_E], exception: _E,
+			traceback: TracebackType):
+		# An unread body leaves the connection in an unknown state.
+		if self._body is None:
+			self._writer.close()
+
+	async def body(self) -> bytes:
+		if self._body is None:
+			self._body = await _read_body(self._reader, self.headers,
+				status=self.status, method=self._method)
+
+			if self._keep_alive \
+					and _delimited(self.headers, self.status, self._method):
+				self._manager._release(self._address, self._reader, self._writer)
+			else:
+				self._writer.close()
+		return self._body
+
+__: type[NetworkManagerResponse] = StreamsNetworkManagerResponse
+
+class StreamsNetworkManagerWebsocket(Protocol):
+	"""A websocket connection, which parses frames as they arrive and queues the
+	messages they make up until they're received. Receiving a queued message
+	doesn't wait at all, and otherwise waits on a single future that a timeout
+	resolves as well as a message.
+	"""
+
+	_loop: AbstractEventLoop
+	_transport: Optional[Transport]
+	_buffer: bytearray
+	# Resolved with the start line and headers of the handshake response.
+	_handshake: Future[tuple[list[str], dict[str, str]]]
+
+	_messages: deque[Union[bytes, str]]
+	# Resolved with whether there's something to receive, or False on timeout.
+	_waiter: Optional[Future[bool]]
+	_closed: Optional[WebsocketClosed]
+	_fragments: list[bytes]
+	_opcode: int
+
+	_paused: bool
+	_drain: Optional[Future[None]]
+
+	def __init__(self, loop: AbstractEventLoop):
+		self._loop = loop
+		self._transport = None
+		self._buffer = bytearray()
+		self._handshake = loop.create_future()
+
+		self._messages = deque()
+		self._waiter = None
+		self._closed = None
+		self._fragments = []
+		self._opcode = OP_CONTINUATION
+
+		self._paused = False
+		self._drain = None
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, exception_type: type[_E], exception: _E,
+			traceback: TracebackType):
+		await self.close()
+
+	def connection_made(self, transport: BaseTransport):
+		self._transport = cast(Transport, transport)
+
+	def connection_lost(self, exception: Optional[Exception]):
+		if not self._handshake.done():
+			self._handshake.set_exception(ConnectionError("connection lost during \
+the websocket handshake"))
+		if self._closed is None:
+			self._closed = WebsocketClosed(1006, "connection lost")
+		self._wake(True)
+		self._resume()
+
+	def pause_writing(self):
+		self._paused = True
+
+	def resume_writing(self):
+		self._paused = False
+		self._resume()
+
+	def _resume(self):
+		if self._drain is not None and not self._drain.done():
+			self._drain.set_result(None)
+		self._drain = None
+
+	def _wake(self, result: bool):
+		if self._waiter is not None and not self._waiter.done():
+			self._waiter.set_result(result)
+
+	def data_received(self, data: bytes):
+		buffer = self._buffer
+		buffer += data
+
+		if not self._handshake.done():
+			end = buffer.find(b"\r\n\r\n")
+			if end < 0:
+				return
+			self._handshake.set_result(_parse_head(bytes(buffer[:end])))
+			del buffer[:end + 4]
+
+		position = 0
+		available = len(buffer)
+		while available - position >= 2:
+			first, second = buffer[position], buffer[position + 1]
+			length = second & 0x7F
+			header = 2
+			if length == 126:
+				header = 4
+				if available - position < header:
+					break
+				length = int.from_bytes(buffer[position + 2:position + 4], "big")
+			elif length == 127:
+				header = 10
+				if available - position < header:
+					break
+				length = int.from_bytes(buffer[position + 2:position + 10], "big")
+
+			if second & 0x80:
+				header = header + 4
+			if available - position < header + length:
+				break
+
+			payload = bytes(buffer[position + header:position + header + length])
+			if second & 0x80:
+				payload = _mask(payload, bytes(buffer[position + header - 4:
+					position + header]))
+			position = position + header + length
+			self._frame(bool(first & 0x80), first & 0x0F, payload)
+		del buffer[:position]
+
+		# Stop reading from the socket while too many messages are unreceived.
+		if len(self._messages) >= _high_water and self._transport is not None:
+			self._transport.pause_reading()
+
+	def _frame(self, final: bool, opcode: int, payload: bytes):
+		if self._closed is not None:
+			return
+
+		if opcode == OP_PING:
+			self._write(OP_PONG, payload)
+		elif opcode == OP_PONG:
+			pass
+		elif opcode == OP_CLOSE:
+			code = int.from_bytes(payload[:2], "big") if len(payload) >= 2 else 1005
+			# Echo the close frame as the protocol asks.
+			self._write(OP_CLOSE, payload[:2])
+			self._close(WebsocketClosed(code, payload[2:].decode("utf-8", "replace")))
+		elif opcode in (OP_CONTINUATION, OP_TEXT, OP_BINARY):
+			if opcode != OP_CONTINUATION:
+				self._opcode = opcode
+
+			if final:
+				if self._fragments:
+					self._fragments.append(payload)
+					payload = b"".join(self._fragments)
+					self._fragments = []
+				self._messages.append(payload.decode() if self._opcode == OP_TEXT \
+					else payload)
+				self._wake(True)
+			else:
+				self._fragments.append(payload)
+		else:
+			reason = f"unknown opcode {opcode}"
+			self._write(OP_CLOSE, (1002).to_bytes(2, "big") + reason.encode())
+			self._close(WebsocketClosed(1002, reason))
+
+	def _close(self, closed: WebsocketClosed):
+		self._closed = closed
+		if self._transport is not None:
+			self._transport.close()
+		self._wake(True)
+
+	def _write(self, opcode: int, payload: bytes):
+		if self._transport is not None and not self._transport.is_closing():
+			self._transport.write(_encode_frame(opcode, payload, mask=True))
+
+	async def close(self, code: int = 1000, reason: str = ""):
+		if self._closed is None:
+			self._write(OP_CLOSE, code.to_bytes(2, "big") + reason.encode())
+			self._close(WebsocketClosed(code, reason))
+
+	async def send(self, data: Union[bytes, str]):
+		if self._closed is not None:
+			raise self._closed
+
+		if isinstance(data, str):
+			self._write(OP_TEXT, data.encode())
+		else:
+			self._write(OP_BINARY, data)
+
+		if self._paused:
+			if self._drain is None:
+				self._drain = self._loop.create_future()
+			await self._drain
+
+	async def receive(self, timeout: Optional[Union[int, float]] = None) \
+			-> Union[bytes, str]:
+		if not self._messages and self._closed is None:
+			waiter: Future[bool] = self._loop.create_future()
+			self._waiter = waiter
+			timer = None if timeout is None \
+				else self._loop.call_later(timeout, _time_out, waiter)
+			try:
+				if not await waiter:
+					raise TimeoutError()
+			finally:
+				self._waiter = None
+				if timer is not None:
+					timer.cancel()
+
+		if self._messages:
+			message = self._messages.popleft()
+			if len(self._messages) == _low_water and self._transport is not None:
+				self._transport.resume_reading()
+			return message
+		raise cast(WebsocketClosed, self._closed)
+
+def _time_out(waiter: Future[bool]):
+	if not waiter.done():
+		waiter.set_result(False)
+
+___: type[NetworkManagerWebsocket] = StreamsNetworkManagerWebsocket
@@ -1,10 +1,13 @@
 from __future__ import annotations
-from typing_extensions import TypeAlias
 from .ducks import JSON as _JSON, CacheManager
 from abc import ABC, abstractmethod
 from itertools import tee
-from typing import Any, Callable, Generator, Generic, Literal, Optional, \
-	TypeVar, Union, cast, overload
+from typing import TYPE_CHECKING, Any, Callable, Generic, Literal, \
+	Optional, TypeVar, Union, cast, overload
+
+if TYPE_CHECKING:
+	# typing_extensions alone takes longer to import than the rest of dpy.data.
+	from typing_extensions import TypeAlias
 
 _T = TypeVar("_T")
 _U = TypeVar("_U")
@@ -28,6 +31,10 @@ class _constructor(ABC, Generic[_T]):
 			cache: Optional[CacheManager] = None) -> _T:
 		"""Constructs the referenced data."""
 
+	@abstractmethod
+	def deconstruct(self, property: str, value: _T, data: dict[str, _JSON]):
+		"""Writes value into data the way construct expects to find it."""
+
 	@overload
 	def __get__(self: _constructorSelf, instance: None, owner: type) \
 			-> _constructorSelf: ...
@@ -71,6 +78,10 @@ class _auto(_constructor[_T]):
 				raise TypeError(f"expected type {self._Type}, found type {type(value)}")
 			return value
 
+	def deconstruct(self, property: str, value: _T, data: dict[str, _JSON]):
+		data[property] = value._to_api() if isinstance(value, Entity) \
+			else cast(_JSON, value)
+
 class _list_constructor(_constructor[list[_T]]):
 	"""Super constructor for lists."""
 
@@ -90,13 +101,28 @@ class _list_constructor(_constructor[list[_T]]):
 		list_return: list[_T] = []
 		# For each item in the list...
 		for value in list_value:
-			# ...run the constructor.
-			construct = cast(_constructor[_T], self._constructor_).construct
-			list_return.append(construct(property, {property: value}))
+			# ...run the constructor, unless the item was already built.
+			list_return.append(cast(_T, value) if isinstance(value, Entity) \
+				else self.construct_item(property, value))
 		return list_return
 
+	def construct_item(self, property: str, value: _JSON) -> _T:
+		"""Constructs a single item of the list."""
+
+		construct = cast(_constructor[_T], self._constructor_).construct
+		return construct(property, {property: value})
+
+	def deconstruct(self, property: str, value: list[_T],
+			data: dict[str, _JSON]):
+		list_data: list[_JSON] = []
+		for item in value:
+			item_data: dict[str, _JSON] = {}
+			self._constructor_.deconstruct(property, item, item_data)
+			list_data.append(item_data[property])
+		data[property] = list_data
+
 class _optional_constructor(_constructor[Optional[_T]]):
-	"""Super constructor for optional data."""
+	"""Super constructor for optional (or nullable) data."""
 
 	_constructor_: _constructor[_T]
 
@@ -107,7 +133,7 @@ class _optional_constructor(_constructor[Optional[_T]]):
 	def construct(self, property: str, data: dict[str, _JSON],
 			cache: Optional[CacheManager] = None) -> Optional[_T]:
 		# If data exists...
-		if property in data:
+		if data.get(property) is not None:
 			# ...then run the constructor.
 			construct = cast(_constructor[_T], self._constructor_).construct
 			return construct(property, data, cache)
@@ -115,16 +141,24 @@ class _optional_constructor(_constructor[Optional[_T]]):
 			# Otherwise return None.
 			return None
 
+	def deconstruct(self, property: str, value: Optional[_T],
+			data: dict[str, _JSON]):
+		if value is not None:
+			self._constructor_.deconstruct(property, value, data)
+
 class _convert_constructor(_constructor[_T], Generic[_U, _T]):
 	"""Super constructor for converting data before storing."""
 
 	_constructor_: _constructor[_U]
 	_convert: Callable[[_U], _T]
+	_revert: Optional[Callable[[_T], _U]]
 
 	def __init__(self, constructor: _constructor[_U],
-			convert: Callable[[_U], _T]):
+			convert: Callable[[_U], _T],
+			revert: Optional[Callable[[_T], _U]] = None):
 		self._constructor_ = constructor
 		self._convert = convert
+		self._revert = revert
 		super().__init__()
 
 	def construct(self, property: str, data: dict[str, _JSON],
@@ -133,6 +167,11 @@ class _convert_constructor(_constructor[_T], Generic[_U, _T]):
 		construct = cast(_constructor[_T], self._constructor_).construct
 		return self._convert(construct(property, data, cache))
 
+	def deconstruct(self, property: str, value: _T, data: dict[str, _JSON]):
+		# Without a revert function, the conversion is taken to be lossless.
+		self._constructor_.deconstruct(property,
+			cast(_U, value) if self._revert is None else self._revert(value), data)
+
 class _entity_reference(_constructor[Union[_T, _U]], Generic[_T, _U]):
 	"""Super constructor for references of things in cache."""
 
@@ -142,7 +181,7 @@ class _entity_reference(_constructor[Union[_T, _U]], Generic[_T, _U]):
 
 	def __init__(self, reference_to: type[_T],
 			fetch: Union[str, CacheFetchFetcher[_U, _T]], *,
-			id: _constructor[_U] = _convert_constructor(_auto(str), int)):
+			id: _constructor[_U] = _convert_constructor(_auto(str), int, str)):
 		self._id_constructor = id
 		self._entity = reference_to
 		self._fetch = fetch
@@ -162,7 +201,7 @@ class _entity_reference(_constructor[Union[_T, _U]], Generic[_T, _U]):
 			# Otherwise use the cache with the identifier to get the desired data.
 			fetcher = getattr(cache, self._fetch) if isinstance(self._fetch, str) \
 				else self._fetch(cache)
-			value = fetcher(data[property])
+			value = fetcher(identifier)
 
 			# Type check.
 			if value is not None and not isinstance(value, self._entity):
@@ -170,6 +209,51 @@ class _entity_reference(_constructor[Union[_T, _U]], Generic[_T, _U]):
 found type {type(value)}")
 			return identifier if value is None else value
 
+	def deconstruct(self, property: str, value: Union[_T, _U],
+			data: dict[str, _JSON]):
+		identifier = cast(_U, getattr(value, "id") if isinstance(value, Entity) \
+			else value)
+		self._id_constructor.deconstruct(property, identifier, data)
+
+def _list_of(constructor: _constructor[Any]) -> Optional[_list_constructor[Any]]:
+	# The list constructor of a (possibly optional) list property, if it is one.
+	while isinstance(constructor, _optional_constructor):
+		constructor = constructor._constructor_
+	return constructor if isinstance(constructor, _list_constructor) else None
+
+def _identify(value: Any) -> Any:
+	# Entity references are either the entity or just its id.
+	return getattr(value, "id", value)
+
+class _typed_constructor(_constructor[_T]):
+	"""Super constructor for entities whose class depends on their type field."""
+
+	_default: type[_T]
+	_types: dict[int, type[_T]]
+
+	def __init__(self, default: type[_T], types: dict[int, type[_T]]):
+		self._default = default
+		self._types = types
+		super().__init__()
+
+	def construct(self, property: str, data: dict[str, _JSON],
+			cache: Optional[CacheManager] = None) -> _T:
+		value = data[property]
+		if not isinstance(value, dict):
+			raise TypeError(f"expected type dict, found type {type(value)}")
+
+		# Pick the class by type, and build it.
+		Type = self._types.get(cast(int, value.get("type")), self._default)
+		return cast(Callable[..., _T], Type)(value, cache)
+
+	def deconstruct(self, property: str, value: _T, data: dict[str, _JSON]):
+		entity_data = cast(Entity, value)._to_api()
+		for key, Type in self._types.items():
+			if Type is type(value):
+				entity_data["type"] = key
+				break
+		data[property] = entity_data
+
 class _as(_constructor[_T]):
 	"""Super constructor for fetching data under a different property name."""
 
@@ -187,6 +271,22 @@ class _as(_constructor[_T]):
 		construct = cast(_constructor[_T], self._constructor_).construct
 		return construct(self._as, data, cache)
 
+	def deconstruct(self, property: str, value: _T, data: dict[str, _JSON]):
+		self._constructor_.deconstruct(self._as, value, data)
+
+# The constructors of each Entity class by name, found when the class is first
+# constructed rather than every time.
+_constructors: dict[type, tuple[tuple[str, _constructor[Any]], ...]] = {}
+
+def _constructors_of(cls: type) -> tuple[tuple[str, _constructor[Any]], ...]:
+	constructors = _constructors.get(cls)
+	if constructors is None:
+		constructors = _constructors[cls] = tuple(
+			(key, property) for key in dir(cls)
+				if isinstance(property := getattr(cls, key), _constructor)
+		)
+	return constructors
+
 class Entity:
 	"""An advanced tuple that can be built from raw JSON data.
 
@@ -201,19 +301,10 @@ class Entity:
 
 	def __init__(self, data: dict[str, _JSON], cache: Optional[CacheManager]=None):
 		def generate():
-			cls = type(self)
-			constructors = cast( # Python type checkers are dumb as ****.
-				Generator[tuple[str, _constructor[int]], None, None],
-				(
-					(key, property) for key in dir(cls)
-						if isinstance(property := getattr(cls, key), _constructor)
-				)
-			)
-
 			def get_getter(index: int):
 				return lambda: self._tuple[index]
 
-			for index, (key, property) in enumerate(constructors):
+			for index, (key, property) in enumerate(_constructors_of(type(self))):
 				try:
 					value = property.construct(key, data, cache)
 				except Exception as exception:
@@ -226,7 +317,15 @@ class Entity:
 		self.__property_map__ = dict(tuple for tuple, _ in dict_generator)
 		self._tuple = tuple(data for _, data in tuple_generator)
 
-_id_constructor = _convert_constructor(_auto(str), int)
+	def _to_api(self) -> dict[str, _JSON]:
+		"""Rebuilds JSON data that this entity could be constructed from."""
+
+		data: dict[str, _JSON] = {}
+		for key, property in _constructors_of(type(self)):
+			property.deconstruct(key, getattr(self, key), data)
+		return data
+
+_id_constructor = _convert_constructor(_auto(str), int, str)
 
 class User(Entity):
 	id = _id_constructor
@@ -253,6 +352,7 @@ class TextChannel(Channel):
 
 class GuildChannel(Channel):
 	name = _auto(str)
+	type = _auto(int)
 
 	def __repr__(self) -> str:
 		return self.name
@@ -261,22 +361,15 @@ class GuildCategoryChannel(GuildChannel):
 	pass
 
 class GuildChildChannel(GuildChannel):
-	parent = _optional_constructor(_entity_reference(GuildCategoryChannel, lambda c: c.get_channel)) #Optional[Union[GuildCategoryChannel, int]]
+	parent = _as(_optional_constructor(_entity_reference(GuildCategoryChannel, lambda c: c.get_channel)), "parent_id") #Optional[Union[GuildCategoryChannel, int]]
 
 class GuildTextChannel(GuildChildChannel, TextChannel):
-	topic = _auto(str)
-	nsfw = _auto(bool)
+	topic = _optional_constructor(_auto(str))
+	nsfw = _convert_constructor(_optional_constructor(_auto(bool)), bool)
 
 	def __str__(self) -> str:
 		return f"<@#{self.id}>"
 
-class Message(Entity):
-	id = _id_constructor
-	content = _auto(str)
-
-	def __str__(self) -> str:
-		return self.content
-
 class Guild(Entity):
 	id = _id_constructor
 
@@ -287,12 +380,16 @@ class Guild(Entity):
 	def __repr__(self) -> str:
 		return "UnavailableGuild"
 
-class AvailableGuild(Guild):
+class Member(Entity):
+	user = _auto(User)
+
+class PartialGuild(Guild):
+	"""A guild as the REST API returns it, without its channels or members."""
+
 	name = _auto(str)
 	owner = _as(_entity_reference(User, lambda c: c.get_user), "owner_id")
 
 	roles = _list_constructor(_auto(Role))
-	channels = _list_constructor(_auto(GuildChannel))
 
 	@property
 	def available(self) -> Literal[True]:
@@ -300,3 +397,21 @@ class AvailableGuild(Guild):
 
 	def __repr__(self) -> str:
 		return self.name
+
+class AvailableGuild(PartialGuild):
+	channels = _list_constructor(_typed_constructor(GuildChildChannel, {
+		0: GuildTextChannel, 4: GuildCategoryChannel, 5: GuildTextChannel
+	}))
+	members = _optional_constructor(_list_constructor(_auto(Member))) #Optional[list[Member]]
+
+class Message(Entity):
+	id = _id_constructor
+	content = _auto(str)
+	author = _auto(User)
+	channel = _as(_entity_reference(Channel, lambda c: c.get_channel),
+		"channel_id")
+	guild = _as(_optional_constructor(_entity_reference(Guild,
+		lambda c: c.get_guild)), "guild_id")
+
+	def __str__(self) -> str:
+		return self.content
@@ -1,7 +1,11 @@
 from __future__ import annotations
 from types import TracebackType
-from .data import *
-from typing import Any, Optional, Protocol, Union, TypeVar, cast, get_origin
+from typing import TYPE_CHECKING, Any, Optional, Protocol, Union, TypeVar, \
+	cast, get_origin
+
+if TYPE_CHECKING:
+	# Only needed for annotations, and dpy.data imports this module.
+	from .data import Guild, GuildChannel, User
 
 _T = TypeVar("_T")
 _E = TypeVar("_E", bound=BaseException)
@@ -30,6 +34,17 @@ class NetworkManager(AsyncWith, Protocol):
 
 	async def request_websocket(self, url: str) -> NetworkManagerWebsocket: ...
 
+class WebsocketClosed(Exception):
+	"""Raised by NetworkManagerWebsocket.receive once the websocket is closed."""
+
+	code: Optional[int]
+	reason: str
+
+	def __init__(self, code: Optional[int], reason: str = ""):
+		super().__init__(f"websocket closed with code {code}: {reason}")
+		self.code = code
+		self.reason = reason
+
 class NetworkManagerWebsocket(AsyncWith, Protocol):
 	async def send(self, data: Union[bytes, str]): ...
 	async def receive(self, timeout: Optional[Union[int, float]] = None) \
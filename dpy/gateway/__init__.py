@@ -2,12 +2,61 @@ from __future__ import annotations
 
 from .events import *
 from ..data import *
+from ..data import _constructors_of, _list_of
 from ..ducks import JSON, CacheManager, GatewayManager, type_check
-from typing import Awaitable, Callable, Optional
+from functools import partial
+from typing import Awaitable, Callable, Optional, TypeVar
+
+_T = TypeVar("_T")
+_N = TypeVar("_N", bound=Entity)
+
+# The typed event built for each dispatch event, and the dispatch events whose
+# entities have to be built regardless of listeners because they are cached.
+_events: dict[str, type[Event]] = {
+	"READY": ReadyEvent,
+	"GUILD_CREATE": GuildCreateEvent,
+	"MESSAGE_CREATE": MessageCreateEvent
+}
+_cached_events = {"READY", "GUILD_CREATE"}
+
+# Entities are built this many at a time, yielding to the event loop in between,
+# so a huge READY or GUILD_CREATE doesn't block it for the whole payload.
+_chunk = 256
+
+async def _build_all(build: Callable[[JSON], _T], items: list[JSON]) -> list[_T]:
+	if len(items) <= _chunk:
+		return [build(item) for item in items]
+
+	# Only imported when needed, as asyncio is slow to import.
+	from asyncio import sleep
+	built: list[_T] = []
+	for start in range(0, len(items), _chunk):
+		if start:
+			await sleep(0)
+		built.extend(build(item) for item in items[start:start + _chunk])
+	return built
+
+async def _construct(Type: type[_N], data: dict[str, JSON],
+		cache: Optional[CacheManager]) -> _N:
+	"""Constructs Type from data like Type(data, cache), but builds the items of
+	its long lists with _build_all first.
+	"""
+
+	data = dict(data)
+	for key, property in _constructors_of(Type):
+		constructor = _list_of(property)
+		items = data.get(key)
+		if constructor is not None and isinstance(items, list) \
+				and len(items) > _chunk:
+			data[key] = await _build_all(partial(constructor.construct_item, key),
+				items)
+	return Type(data, cache)
 
 async def process_payload(payload: JSON, token: str, *,
 		dispatch: Callable[[Event], Awaitable[None]], manager: GatewayManager,
-		cache: Optional[CacheManager] = None):
+		cache: Optional[CacheManager] = None,
+		dispatch_raw: Optional[Callable[[str, JSON], Awaitable[None]]] = None,
+		listening: Optional[Callable[[type[Event]], bool]] = None):
 	if not isinstance(payload, dict):
 		raise TypeError(f"expected type dict, found type {type(payload)}")
 
@@ -18,12 +67,20 @@ async def process_payload(payload: JSON, token: str, *,
 		data = type_check(data, dict[str, JSON])
 		event = type_check(payload["t"], str)
 
+		if dispatch_raw is not None:
+			await dispatch_raw(event, data)
+
+		# If nobody listens for the typed event and there's nothing to cache, don't
+		# bother building any entities.
+		if listening is not None and not listening(_events.get(event, Event)) \
+				and (cache is None or event not in _cached_events):
+			return
+
 		if event == "READY":
 			user = SelfUser(type_check(data["user"], dict[str, JSON]), cache)
-			guilds = [
-				Guild(type_check(guild, dict[str, JSON]), cache) \
-					for guild in type_check(data["guilds"], list[JSON])
-			]
+			guilds = await _build_all(
+				lambda guild: Guild(type_check(guild, dict[str, JSON]), cache),
+				type_check(data["guilds"], list[JSON]))
 
 			if cache is not None:
 				for guild in guilds:
@@ -32,7 +89,7 @@ async def process_payload(payload: JSON, token: str, *,
 
 			await dispatch(ReadyEvent(user, guilds))
 		elif event == "GUILD_CREATE":
-			guild = AvailableGuild(data, cache)
+			guild = await _construct(AvailableGuild, data, cache)
 
 			if cache is not None:
 				await cache.cache_guild(guild)
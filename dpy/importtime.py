@@ -0,0 +1,71 @@
+"""Measures how long dpy's entry points take to import, using python's
+-X importtime, each in a fresh interpreter.
+
+Run with python -m dpy.importtime [--runs N] [--json PATH] [MODULE ...].
+"""
+
+from __future__ import annotations
+from argparse import ArgumentParser
+from json import dump
+from statistics import median
+from subprocess import run
+from sys import executable
+from typing import Optional
+
+entry_points = ("dpy", "dpy.data", "dpy.gateway", "dpy.convenient", "dpy.rest")
+
+def _parse(output: str) -> dict[str, tuple[int, int]]:
+	# Lines look like "import time:  self [us] | cumulative | imported package".
+	imports: dict[str, tuple[int, int]] = {}
+	for line in output.splitlines():
+		if not line.startswith("import time:"):
+			continue
+		fields = line[len("import time:"):].split("|")
+		if len(fields) != 3 or not fields[0].strip().isdigit():
+			continue # The header.
+		imports[fields[2].strip()] = int(fields[0]), int(fields[1])
+	return imports
+
+def measure(module: str, *, runs: int = 5) -> tuple[float, list[tuple[int, str]]]:
+	"""Imports module runs times, returning the median cumulative import time
+	and the imports that took longest themselves (from the fastest run), in
+	microseconds.
+	"""
+
+	times: list[int] = []
+	fastest: Optional[dict[str, tuple[int, int]]] = None
+	for _ in range(runs):
+		result = run([executable, "-X", "importtime", "-c", f"import {module}"],
+			capture_output=True, text=True, check=True)
+		imports = _parse(result.stderr)
+		times.append(imports[module][1])
+		if fastest is None or times[-1] == min(times):
+			fastest = imports
+
+	assert fastest is not None
+	slowest = sorted(((own, name) for name, (own, _) in fastest.items()),
+		reverse=True)
+	return median(times), slowest[:5]
+
+def main(arguments: Optional[list[str]] = None):
+	parser = ArgumentParser(prog="python -m dpy.importtime",
+		description="Measure the import time of dpy's entry points.")
+	parser.add_argument("modules", nargs="*", default=entry_points)
+	parser.add_argument("--runs", type=int, default=5)
+	parser.add_argument("--json", help="also write the results to this file")
+	options = parser.parse_args(arguments)
+
+	results: dict[str, float] = {}
+	for module in options.modules:
+		time, slowest = measure(module, runs=options.runs)
+		results[module] = time
+		print(f"{module}: {time / 1000:.1f}ms")
+		for own, name in slowest:
+			print(f"\t{own / 1000:6.1f}ms {name}")
+
+	if options.json is not None:
+		with open(options.json, "w") as file:
+			dump(results, file, indent="\t")
+
+if __name__ == "__main__":
+	main()
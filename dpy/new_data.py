@@ -1,7 +1,7 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
 from itertools import count
-from typing import Any, Optional
+from typing import Any, ClassVar, Optional
 
 def bounded_property(internal: str, start: int, end: int):
 	def getter(self):
@@ -40,14 +40,36 @@ class NewGuild:
 		self._roles = []
 		self._channels = []
 
+	def _counter(self) -> count:
+		# Placeholder ids are shared by roles and channels and must not collide
+		# with ones assigned by earlier calls. They start at 1, as id 0 is taken by
+		# @everyone.
+		ids = [child._id for child in (*self._roles, *self._channels) \
+			if child._id is not None]
+		return count(max(ids, default=0) + 1)
+
 	def _to_api(self) -> dict[str, Any]:
 		if self._name is None:
 			raise ValueError(f'property "name" must be set')
 
+		for channel in self._channels:
+			if isinstance(channel, NewGuildChildChannel) \
+					and channel.parent is not None \
+					and channel.parent not in self._channels:
+				raise ValueError(f'parent of channel "{channel.name}" must be one of \
+the guild\'s channels')
+
+		counter = self._counter()
+		# Categories get their ids first, so children can refer to them.
+		channels = sorted(self._channels,
+			key=lambda channel: not isinstance(channel, NewGuildCategoryChannel))
+		serialized = {id(channel): channel._to_api(counter) for channel in channels}
+
 		return {
 			"name": self._name,
-			"roles": [role._to_api(count()) for role in self._roles],
-			"channels": [channel._to_api(count()) for channel in self._channels]
+			# Discord applies the first role to @everyone, so it goes first.
+			"roles": [{"id": 0}, *(role._to_api(counter) for role in self._roles)],
+			"channels": [serialized[id(channel)] for channel in self._channels]
 		}
 
 class NewRole:
@@ -64,24 +86,33 @@ class NewRole:
 	def __init__(self):
 		self._id = None
 		self._name = None
+		self.hoist = False
+		self.mentionable = False
+
+	def _fields(self) -> dict[str, Any]:
+		"""The role as Discord takes it outside of a guild creation, which has no
+		placeholder id or position.
+		"""
 
-	def _to_api(self, counter: count) -> dict[str, Any]:
 		if self._name is None:
 			raise ValueError(f'property "name" must be set')
 
-		if self._id is None:
-			self._id = next(counter)
-
 		return {
-			"id": self._id,
 			"name": self._name,
 			"color": 0,
 			"hoist": self.hoist,
-			"position": self._id,
 			"mentionable": self.mentionable
 		}
 
+	def _to_api(self, counter: count) -> dict[str, Any]:
+		fields = self._fields()
+		if self._id is None:
+			self._id = next(counter)
+
+		return {"id": self._id, **fields, "position": self._id}
+
 class NewGuildChannel(ABC):
+	_type: ClassVar[int]
 	_id: Optional[int]
 	_name: Optional[str]
 
@@ -90,7 +121,17 @@ class NewGuildChannel(ABC):
 		self._name = None
 
 	@abstractmethod
-	def _to_api(self, counter: count) -> dict[str, Any]: ...
+	def _fields(self) -> dict[str, Any]:
+		"""The channel as Discord takes it outside of a guild creation, which has
+		no placeholder id or parent.
+		"""
+
+	def _to_api(self, counter: count) -> dict[str, Any]:
+		fields = self._fields()
+		if self._id is None:
+			self._id = next(counter)
+
+		return {"id": self._id, **fields}
 
 	@bounded_setter("_name", 1, 100)
 	def name(self) -> Optional[str]:
@@ -102,22 +143,35 @@ class NewGuildChannel(ABC):
 		return name
 
 class NewGuildCategoryChannel(NewGuildChannel):
-	def _to_api(self, counter: count) -> dict[str, Any]:
+	_type = 4
+
+	def _fields(self) -> dict[str, Any]:
 		if self._name is None:
 			raise ValueError(f'property "name" must be set')
 
-		if self._id is None:
-			self._id = next(counter)
-
 		return {
-			"id": self._id,
-			"type": 4,
+			"type": self._type,
 			"name": self.name
 		}
 
 class NewGuildChildChannel(NewGuildChannel):
 	parent: Optional[NewGuildCategoryChannel]
 
+	def __init__(self):
+		super().__init__()
+		self.parent = None
+
+	def _parent_id(self) -> Optional[int]:
+		if self.parent is None:
+			return None
+		if self.parent._id is None:
+			raise ValueError(f'parent of channel "{self.name}" must be serialized \
+first')
+		return self.parent._id
+
+	def _to_api(self, counter: count) -> dict[str, Any]:
+		return {**super()._to_api(counter), "parent_id": self._parent_id()}
+
 class NewGuildTextChannel(NewGuildChildChannel):
 	_topic: Optional[str]
 
@@ -125,22 +179,22 @@ class NewGuildTextChannel(NewGuildChildChannel):
 
 	nsfw: bool
 
+	_type = 0
+
 	def __init__(self):
 		super().__init__()
 		self._topic = None
+		self.nsfw = False
 
-	def _to_api(self, counter: count) -> dict[str, Any]:
+	def _fields(self) -> dict[str, Any]:
 		if self._name is None:
 			raise ValueError(f'property "name" must be set')
 
-		if self._id is None:
-			self._id = next(counter)
-
 		return {
-			"id": self._id,
-			"type": 0,
+			"type": self._type,
 			"name": self.name,
-			"topic": self._topic
+			"topic": self._topic,
+			"nsfw": self.nsfw
 		}
 
 	@staticmethod
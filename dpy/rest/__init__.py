@@ -1,19 +1,87 @@
 from __future__ import annotations
 from ..data import *
 from ..new_data import *
-from aiohttp import ClientSession
-from itertools import count
+from ..ducks import JSON, type_check
+from asyncio import Queue, Semaphore, Task, ensure_future, gather, sleep
 from json import dumps
-from typing import Optional
+from re import compile
+from time import monotonic
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterable, Mapping, \
+	Optional
+
+if TYPE_CHECKING:
+	from aiohttp import ClientSession
+
+_done = object()
+
+# The part of a route Discord scopes rate limits by, along with the bucket.
+_major_parameter = compile(r"/(?:channels|guilds)/\d+|/webhooks/\d+/[^/]+")
+_id = compile(r"/\d+")
+
+class _Bucket:
+	"""A rate limit bucket, as last reported by Discord, less the requests that
+	are still in flight.
+	"""
+
+	limit: int
+	remaining: int
+	reset: float
+	reset_after: float
+	pending: int
+
+	def __init__(self):
+		self.limit = 1
+		self.remaining = 1
+		self.reset = 0
+		self.reset_after = 0
+		self.pending = 0
+
+	async def acquire(self):
+		while self.remaining <= 0:
+			now = monotonic()
+			if now < self.reset:
+				await sleep(self.reset - now)
+			elif self.pending < self.limit:
+				# A new window started. Until Discord says otherwise, expect it to be
+				# like the last one.
+				self.remaining = self.limit - self.pending
+				self.reset = now + self.reset_after
+			else:
+				# Wait for the requests in flight to report on the new window.
+				await sleep(0.05)
+		self.remaining = self.remaining - 1
+		self.pending = self.pending + 1
+
+	def release(self):
+		self.pending = self.pending - 1
+
+	def update(self, headers: Mapping[str, str]):
+		if "x-ratelimit-remaining" in headers:
+			self.limit = int(headers.get("x-ratelimit-limit", self.limit))
+			self.remaining = int(headers["x-ratelimit-remaining"]) - self.pending
+			self.reset_after = float(headers["x-ratelimit-reset-after"])
+			self.reset = monotonic() + self.reset_after
 
 class RESTClient:
 	_token: str
 	base = "https://discord.com/api/v9"
 	session: ClientSession
 
+	# Routes (without their ids) to the bucket Discord put them in, and buckets
+	# by their name and major parameter.
+	_bucket_names: dict[str, str]
+	_buckets: dict[tuple[str, str], _Bucket]
+
 	def __init__(self, token: str, session: Optional[ClientSession] = None):
 		self._token = token
-		self.session = session or ClientSession()
+		if session is None:
+			# aiohttp is only imported once it's needed, as it's slow to import.
+			from aiohttp import ClientSession
+			session = ClientSession()
+		self.session = session
+
+		self._bucket_names = {}
+		self._buckets = {}
 
 	async def __aenter__(self):
 		await self.session.__aenter__()
@@ -22,21 +90,54 @@ class RESTClient:
 	async def __aexit__(self, exception_type, exception, traceback):
 		await self.session.__aexit__(exception_type, exception, traceback)
 
-	async def create_guild(self, guild: NewGuild) -> AvailableGuild:
-		endpoint = f"{self.base}/guilds"
-		print(endpoint)
-		data = dumps(guild._to_api())
-		headers = {
-			"content-type": "application/json",
-			"authorization": self._token
-		}
+	async def _request(self, method: str, route: str,
+			payload: Optional[Any] = None, *,
+			params: Optional[dict[str, str]] = None) -> JSON:
+		endpoint = f"{self.base}{route}"
+		data = None if payload is None else dumps(payload)
+		headers = {"authorization": self._token}
+		if data is not None:
+			headers["content-type"] = "application/json"
+
+		key = f"{method} {_id.sub('/:id', route)}"
+		match = _major_parameter.match(route)
+		major = "" if match is None else match.group()
+		while True:
+			name = self._bucket_names.get(key)
+			bucket = None if name is None else self._buckets.get((name, major))
+			if bucket is not None:
+				await bucket.acquire()
+
+			try:
+				async with self.session.request(method, endpoint, data=data,
+						headers=headers, params=params) as response:
+					if bucket is not None:
+						bucket.release()
+						bucket = None
+
+					name = response.headers.get("x-ratelimit-bucket")
+					if name is not None:
+						self._bucket_names[key] = name
+						self._buckets.setdefault((name, major), _Bucket()) \
+							.update(response.headers)
+
+					if response.status == 429:
+						# Rate limited, wait as long as we're told to and try again.
+						await sleep(float((await response.json())["retry_after"]))
+						continue
+
+					response.raise_for_status()
+					return None if response.status == 204 else await response.json()
+			finally:
+				if bucket is not None:
+					bucket.release()
 
-		async with self.session.post(endpoint, data=data, headers=headers) \
-				as response:
-			return AvailableGuild._from_api(None, await response.json())
+	async def create_guild(self, guild: NewGuild) -> PartialGuild:
+		data = await self._request("POST", "/guilds", guild._to_api())
+		return PartialGuild(type_check(data, dict[str, JSON]))
 
-	async def delete_guild(self, guild: Union[AvailableGuild, int]):
-		guild: int = guild.id if isinstance(guild, AvailableGuild) else guild
+	async def delete_guild(self, guild: Union[Guild, int]):
+		guild: int = guild.id if isinstance(guild, Guild) else guild
 		endpoint = f"{self.base}/guilds/{guild}"
 		headers = {
 			"authorization": self._token
@@ -45,16 +146,35 @@ class RESTClient:
 		async with self.session.delete(endpoint, headers=headers):
 			pass
 
-	async def create_guild_channel(self, guild: int, channel: NewGuildChannel):
-		async with self.session.post(
-					f"https://discord.com/api/v9/guilds/{guild}/channels",
-					data=dumps(channel._to_api(count())),
-					headers={
-						"content-type": "application/json",
-						"authorization": self._token
-					}
-				) as session:
-			print(session)
+	async def create_guild_channel(self, guild: int, channel: NewGuildChannel, *,
+			parent: Optional[int] = None) -> GuildChannel:
+		payload = channel._fields()
+		if isinstance(channel, NewGuildChildChannel):
+			payload["parent_id"] = parent
+
+		data = await self._request("POST", f"/guilds/{guild}/channels", payload)
+		return GuildChannel(type_check(data, dict[str, JSON]))
+
+	async def move_guild_channel(self, channel: Union[GuildChannel, int],
+			parent: Optional[int]) -> GuildChannel:
+		channel: int = channel.id if isinstance(channel, GuildChannel) else channel
+		data = await self._request("PATCH", f"/channels/{channel}",
+			{"parent_id": parent})
+		return GuildChannel(type_check(data, dict[str, JSON]))
+
+	async def delete_channel(self, channel: Union[Channel, int]):
+		channel: int = channel.id if isinstance(channel, Channel) else channel
+		await self._request("DELETE", f"/channels/{channel}")
+
+	async def create_guild_role(self, guild: int, role: NewRole) -> Role:
+		payload = role._fields()
+
+		data = await self._request("POST", f"/guilds/{guild}/roles", payload)
+		return Role(type_check(data, dict[str, JSON]))
+
+	async def delete_guild_role(self, guild: int, role: Union[Role, int]):
+		role: int = role.id if isinstance(role, Role) else role
+		await self._request("DELETE", f"/guilds/{guild}/roles/{role}")
 
 	async def create_message(self, channel: Union[TextChannel, int],
 			message: NewMessage):
@@ -69,3 +189,93 @@ class RESTClient:
 		async with self.session.post(endpoint, data=data, headers=headers) as r:
 			print(await r.json())
 			print(r.status)
+
+	async def history(self, channel: Union[TextChannel, int], *,
+			before: Optional[int] = None, after: Optional[int] = None,
+			limit: Optional[int] = None, page_size: int = 100) \
+			-> AsyncIterator[Message]:
+		"""Yields the messages of channel, newest first (or oldest first if after
+		is given), fetching the next page while the current one is processed.
+		"""
+
+		if before is not None and after is not None:
+			raise ValueError("only one of before and after can be given")
+		if not 1 <= page_size <= 100:
+			raise ValueError("page_size must be between 1 and 100")
+
+		channel: int = channel.id if isinstance(channel, TextChannel) else channel
+		forward = after is not None
+
+		async def fetch(cursor: Optional[int], size: int) -> list[Message]:
+			params = {"limit": str(size)}
+			if cursor is not None:
+				params["after" if forward else "before"] = str(cursor)
+
+			data = await self._request("GET", f"/channels/{channel}/messages",
+				params=params)
+			messages = [
+				Message(type_check(message, dict[str, JSON])) \
+					for message in type_check(data, list[JSON])
+			]
+			messages.sort(key=lambda message: message.id, reverse=not forward)
+			return messages
+
+		remaining = limit
+		size = page_size if remaining is None else min(page_size, remaining)
+		page: Optional[Task[list[Message]]] = \
+			ensure_future(fetch(after if forward else before, size)) \
+				if size > 0 else None
+		try:
+			while page is not None:
+				messages = await page
+				page = None
+
+				if remaining is not None:
+					remaining = remaining - len(messages)
+				# A short page means there's nothing left.
+				if len(messages) == size and remaining != 0:
+					size = page_size if remaining is None \
+						else min(page_size, remaining)
+					page = ensure_future(fetch(messages[-1].id, size))
+
+				for message in messages:
+					yield message
+		finally:
+			if page is not None:
+				page.cancel()
+
+	async def backfill(self, channels: Iterable[Union[TextChannel, int]], *,
+			concurrency: int = 4, buffer: int = 1000, **history: Any) \
+			-> AsyncIterator[Message]:
+		"""Yields the history of all of channels (see history for the keyword
+		arguments), reading at most concurrency channels at a time and holding at
+		most buffer messages that haven't been yielded yet.
+		"""
+
+		queue: Queue[Any] = Queue(buffer)
+		semaphore = Semaphore(concurrency)
+
+		async def drain(channel: Union[TextChannel, int]):
+			async with semaphore:
+				async for message in self.history(channel, **history):
+					await queue.put(message)
+
+		async def produce():
+			tasks = [ensure_future(drain(channel)) for channel in channels]
+			try:
+				await gather(*tasks)
+			except Exception:
+				for task in tasks:
+					task.cancel()
+				await queue.put(_done)
+				raise
+			await queue.put(_done)
+
+		producer = ensure_future(produce())
+		try:
+			while (message := await queue.get()) is not _done:
+				yield message
+			# Raises whatever stopped the producer, if anything.
+			await producer
+		finally:
+			producer.cancel()
@@ -0,0 +1,173 @@
+from __future__ import annotations
+from . import RESTClient
+from ..data import *
+from ..data import _identify
+from ..new_data import *
+from asyncio import Semaphore, gather
+from dataclasses import dataclass, field
+from typing import Awaitable, Iterable, Optional, TypeVar
+
+_T = TypeVar("_T")
+
+@dataclass
+class GuildTemplateDiff:
+	"""What separates a guild from a template."""
+
+	roles: list[NewRole] = field(default_factory=list)
+	categories: list[NewGuildCategoryChannel] = field(default_factory=list)
+	channels: list[NewGuildChannel] = field(default_factory=list)
+	# The ids of the template's categories that already exist, by name.
+	existing_categories: dict[str, int] = field(default_factory=dict)
+	# Existing channels under the wrong category, with what they should be.
+	moved_channels: list[tuple[GuildChildChannel, NewGuildChildChannel]] = \
+		field(default_factory=list)
+	# Existing channels of the wrong type, which are replaced by new ones.
+	replaced_channels: list[GuildChannel] = field(default_factory=list)
+
+	stale_roles: list[Role] = field(default_factory=list)
+	stale_channels: list[GuildChannel] = field(default_factory=list)
+
+	@property
+	def empty(self) -> bool:
+		return not (self.roles or self.categories or self.channels \
+			or self.moved_channels or self.replaced_channels \
+			or self.stale_roles or self.stale_channels)
+
+class GuildTemplate:
+	"""A guild layout, which can create new guilds or bring existing ones in line
+	with it.
+
+	Roles and channels are matched with existing ones by name. Matching channels
+	of the wrong type are replaced, and ones under the wrong category are moved.
+	The template is validated (by serializing it) when created.
+	"""
+
+	guild: NewGuild
+
+	def __init__(self, guild: NewGuild):
+		guild._to_api()
+		for kind, names in ("role", [role.name for role in guild.roles]), \
+				("channel", [channel.name for channel in guild.channels]):
+			if len(set(names)) != len(names):
+				raise ValueError(f"{kind} names of a template must be unique")
+		self.guild = guild
+
+	def diff(self, guild: AvailableGuild) -> GuildTemplateDiff:
+		roles = {role.name: role for role in guild.roles}
+		channels = {channel.name: channel for channel in guild.channels}
+		diff = GuildTemplateDiff()
+
+		for role in self.guild.roles:
+			if roles.pop(role.name, None) is None:
+				diff.roles.append(role)
+
+		# Categories come first, so children know whether theirs already exists.
+		for channel in sorted(self.guild.channels,
+				key=lambda channel: not isinstance(channel, NewGuildCategoryChannel)):
+			existing = channels.pop(channel.name, None)
+			if existing is not None and existing.type != channel._type:
+				diff.replaced_channels.append(existing)
+				existing = None
+
+			if existing is None:
+				if isinstance(channel, NewGuildCategoryChannel):
+					diff.categories.append(channel)
+				else:
+					diff.channels.append(channel)
+			elif isinstance(channel, NewGuildCategoryChannel):
+				diff.existing_categories[channel.name] = existing.id
+			elif isinstance(channel, NewGuildChildChannel) \
+					and isinstance(existing, GuildChildChannel):
+				# A category that's yet to be created is never the current parent.
+				parent = None if channel.parent is None \
+					else diff.existing_categories.get(channel.parent.name, -1)
+				if _identify(existing.parent) != parent:
+					diff.moved_channels.append((existing, channel))
+
+		# @everyone can't be deleted.
+		diff.stale_roles = [role for role in roles.values() if role.id != guild.id]
+		diff.stale_channels = list(channels.values())
+		return diff
+
+	async def provision(self, client: RESTClient) -> PartialGuild:
+		"""Creates a new guild from this template in a single request."""
+
+		return await client.create_guild(self.guild)
+
+	async def apply(self, client: RESTClient, guild: AvailableGuild, *,
+			prune: bool = False, concurrency: int = 8,
+			semaphore: Optional[Semaphore] = None) -> GuildTemplateDiff:
+		"""Creates whatever roles and channels guild lacks, fixes the ones it has
+		(and deletes whatever it has that the template doesn't if prune is set),
+		running at most concurrency requests at a time, or sharing semaphore with
+		other applications.
+		"""
+
+		semaphore = Semaphore(concurrency) if semaphore is None else semaphore
+		diff = self.diff(guild)
+
+		async def limited(request: Awaitable[_T]) -> _T:
+			async with semaphore:
+				return await request
+
+		# Categories come first, as their ids are needed to create children.
+		*_, categories = await gather(
+			gather(*(limited(client.create_guild_role(guild.id, role)) \
+				for role in diff.roles)),
+			gather(*(limited(client.delete_channel(channel)) \
+				for channel in diff.replaced_channels)),
+			gather(*(limited(client.create_guild_channel(guild.id, category)) \
+				for category in diff.categories))
+		)
+		parents = dict(diff.existing_categories)
+		parents.update((category.name, channel.id) \
+			for category, channel in zip(diff.categories, categories))
+
+		def parent(channel: NewGuildChannel) -> Optional[int]:
+			if isinstance(channel, NewGuildChildChannel) \
+					and channel.parent is not None:
+				return parents[channel.parent.name]
+			return None
+
+		await gather(
+			*(limited(client.create_guild_channel(guild.id, channel,
+				parent=parent(channel))) for channel in diff.channels),
+			*(limited(client.move_guild_channel(existing, parent(channel))) \
+				for existing, channel in diff.moved_channels)
+		)
+
+		if prune:
+			await gather(
+				*(limited(client.delete_guild_role(guild.id, role)) \
+					for role in diff.stale_roles),
+				*(limited(client.delete_channel(channel)) \
+					for channel in diff.stale_channels)
+			)
+		return diff
+
+	async def apply_many(self, client: RESTClient,
+			guilds: Iterable[AvailableGuild], *, prune: bool = False,
+			concurrency: int = 8) -> list[GuildTemplateDiff]:
+		"""Applies this template to all of guilds at once, running at most
+		concurrency requests at a time across all of them.
+		"""
+
+		semaphore = Semaphore(concurrency)
+		return await gather(*(
+			self.apply(client, guild, prune=prune, semaphore=semaphore) \
+				for guild in guilds
+		))
+
+	async def provision_many(self, client: RESTClient, amount: int, *,
+			concurrency: int = 8) -> list[PartialGuild]:
+		"""Creates amount new guilds from this template, running at most
+		concurrency requests at a time.
+		"""
+
+		semaphore = Semaphore(concurrency)
+
+		async def provision() -> PartialGuild:
+			async with semaphore:
+				return await self.provision(client)
+
+		return await gather(*(provision() for _ in range(amount)))